@@ -1,13 +1,23 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, RootModel
 from typing import Dict, List, Tuple, Union, Optional, Set
+from contextlib import asynccontextmanager
+import compute
 import graph_utils
-from timeline import TimeLine, TimeLineNode, find_node_by_id  # Import TimeLine and TimeLineNode
+from lru_cache import LRUCache
+from sessions import SESSION_COOKIE, Session, SessionManager, new_session_id
+from timeline import TimeLine, TimeLineNode, validate_changes  # Import TimeLine and TimeLineNode
 import json
 import time
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    compute.shutdown()
+    SESSIONS.close()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:3000",
@@ -19,13 +29,57 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
-# Global timeline object
-TIMELINE = TimeLine()
+# Timeline and core data of every client, selected by the X-Session-Id
+# header or the session cookie
+SESSIONS = SessionManager()
+
+@app.middleware("http")
+async def assign_session(request: Request, call_next):
+    """
+    Picks the session ID of a request. Clients that send none get a new one
+    in a cookie, so that every browser works on its own timeline.
+    """
+    session_id = request.headers.get("x-session-id") or request.cookies.get(SESSION_COOKIE)
+    issued = session_id is None and request.method != "OPTIONS"
+    if issued:
+        session_id = new_session_id()
+    request.state.session_id = session_id
+    response = await call_next(request)
+    if issued:
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="lax")
+    return response
 
 HIDDEN_TIMELINE = TimeLine()
 
+def get_since_revision(x_timeline_revision: Optional[str] = Header(default=None)) -> Optional[Tuple[int, int]]:
+    """
+    Timeline revision the client already has, sent as "<timeline_id>:<revision>".
+    Responses to such clients carry only the timeline nodes appended since.
+    """
+    if not x_timeline_revision:
+        return None
+    try:
+        timeline_id, revision = x_timeline_revision.split(":")
+        return int(timeline_id), int(revision)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid X-Timeline-Revision header")
+
+async def get_session(request: Request) -> Session:
+    """
+    Session of the request, see assign_session. Async so that the session
+    store is only used from the event loop.
+    """
+    return SESSIONS.get(request.state.session_id)
+
+# Request headers that /get_current_graph bodies depend on besides the ETag
+CURRENT_GRAPH_VARY = "X-Timeline-Revision, X-Session-Id, Cookie"
+
+# Polygon data keyed by graph version; a mutation moves to a new version
+POLYGON_CACHE = LRUCache(maxsize=16)
+
 class EdgeList(BaseModel):
     edges: List[List[int]]
 
@@ -40,6 +94,15 @@ class EdgeOperation(BaseModel):
     target: int
     algo_running: int
 
+class EdgeChange(BaseModel):
+    action: int  # 1=add, 0=remove
+    source: int
+    target: int
+
+class EdgeBatch(BaseModel):
+    operations: List[EdgeChange]
+    algo_running: int = 0
+
 class CoreStructure(BaseModel):
     nodes: List[int]
     edges: List[Union[List[int], Tuple[int, int]]]
@@ -48,9 +111,20 @@ class CoreStructure(BaseModel):
 class AlgorithmsResponse(BaseModel):
     core_data: Dict[int, CoreStructure]
     timeline: Optional[Dict] = None  # This should be a plain dictionary
+    timeline_id: Optional[int] = None
+    revision: Optional[int] = None  # Timeline revision this response brings the client to
+    timeline_delta: Optional[List[Dict]] = None  # Nodes appended since the client's revision
+
+class SubtreeResponse(BaseModel):
+    timeline_id: int
+    revision: int
+    current_node: int
+    subtree: Dict  # Nested nodes with a child_count each, see TimeLine.subtree
 
 class NavigationRequest(BaseModel):
     node_id: int    
+    compress: bool = False  # Only send the net edge diff instead of every step
+    max_replay: Optional[int] = None  # Longer paths are applied by the server instead of the client
     
 class NavigationStep(BaseModel):
     action: int  # 1=add, 0=remove
@@ -59,6 +133,16 @@ class NavigationStep(BaseModel):
 
 class NavigationResponse(BaseModel):
     action_sequence: List[NavigationStep]
+    applied: bool = False  # The server already brought the graph to the node
+    core_data: Optional[Dict[int, CoreStructure]] = None  # Core data at the node when applied
+
+class CoreDataAtResponse(BaseModel):
+    node_id: int
+    core_data: Dict[int, CoreStructure]
+
+class TimelineDiffResponse(BaseModel):
+    added: List[List[int]]  # Edges present only at the "to" node
+    removed: List[List[int]]  # Edges present only at the "from" node
 
 class PolygonComponent(BaseModel):
     nodes: List[int]
@@ -69,10 +153,35 @@ class PolygonLevel(RootModel):
 class PolygonResponse(BaseModel):
     polygon_data: Dict[int, PolygonLevel]
 
-@app.post("/initialize_graph", response_model=AlgorithmsResponse)
-async def initialize_graph(value: Value):
-    global TIMELINE, global_core_data
+def _algorithms_response(session, since=None, full_tree=False):
+    """
+    Builds the JSON response with the session's core data and its timeline:
+    only the nodes appended since the client's revision when it sent one we
+    can serve, otherwise the full tree if it sent one or asked for it.
+    Clients without either fetch the parts of the tree they show from
+    /timeline/subtree.
+    """
+    timeline = session.timeline
+    response = AlgorithmsResponse(
+        core_data=session.core_data,
+        timeline_id=timeline.uid,
+        revision=timeline.revision
+    )
+    if since is not None:
+        response.timeline_delta = timeline.delta_since(*since)
+    if response.timeline_delta is not None:
+        return Response(content=response.model_dump_json(), media_type="application/json")
+    if not full_tree and since is None:
+        return Response(content=response.model_dump_json(exclude={"timeline"}), media_type="application/json")
+
+    # The full tree is serialized iteratively; deep histories exceed the
+    # nesting depth the model serializer supports
+    content = response.model_dump_json(exclude={"timeline"})
+    content = content[:-1] + ',"timeline":' + timeline.root.to_json() + '}'
+    return Response(content=content, media_type="application/json")
 
+@app.post("/initialize_graph", response_model=AlgorithmsResponse)
+async def initialize_graph(value: Value, session: Session = Depends(get_session), full_tree: bool = False):
     if value.value == 1:
         with open("graphs/sample_graph1.json", "r") as f:
             edges = json.load(f)
@@ -101,134 +210,281 @@ async def initialize_graph(value: Value):
     else:
         raise HTTPException(status_code=400, detail="Invalid value. Please use 1, 2, or 3.")
     
-    TIMELINE = TimeLine()
+    async with session.lock:
+        return await compute.run_stateful(_load_graph, session, edges, full_tree)
+
+def _load_graph(session, edges, full_tree=False):
+    session.reset_timeline()
     
     # Add all edges directly to graph (no timeline recording)
-    for u, v in edges:
-        TIMELINE.graph.add_edge(u, v)
+    session.timeline.load_edges(edges)
     
     # Compute core data
-    global_core_data = graph_utils.run_all_kcores(edges)
+    session.core_data = session.timeline.core_data()
     
     # Return response with empty timeline (root has no children)
-    return AlgorithmsResponse(
-        core_data=global_core_data,
-        timeline=TIMELINE.root.to_dict()  # Will show empty root node
-    )
+    return _algorithms_response(session, full_tree=full_tree)
 
 @app.post("/execute_algorithms", response_model=AlgorithmsResponse)
-async def calculate_k_cores(edge_list: EdgeList):
-    global TIMELINE, global_core_data
-
+async def calculate_k_cores(edge_list: EdgeList, session: Session = Depends(get_session),
+                            full_tree: bool = False):
     edges = edge_list.edges
     if not edges:
         raise HTTPException(status_code=400, detail="Edge list cannot be empty")
+
+    async with session.lock:
+        return await compute.run_stateful(_record_graph, session, edges, full_tree)
+
+def _record_graph(session, edges, full_tree):
     
     # Reset the timeline with the new graph
-    TIMELINE = TimeLine()
+    session.reset_timeline()
     for edge in edges:
-        TIMELINE.add_change(1, edge[0], edge[1])  # Add all edges to the timeline
+        session.timeline.add_change(1, edge[0], edge[1])  # Add all edges to the timeline
     
-    # Compute core data
-    global_core_data = graph_utils.run_all_kcores(edges)
-    return AlgorithmsResponse(core_data=global_core_data, timeline=TIMELINE.root.to_dict())
+    # Compute core data (a fresh timeline defers maintenance to this one decomposition)
+    session.core_data = session.timeline.core_data()
+    return _algorithms_response(session, full_tree=full_tree)
 
 @app.post("/add_edge", response_model=AlgorithmsResponse)
-async def add_edge(edge_op: EdgeOperation):
-    global TIMELINE, global_core_data
+async def add_edge(edge_op: EdgeOperation, session: Session = Depends(get_session),
+                   since: Optional[Tuple[int, int]] = Depends(get_since_revision), full_tree: bool = False):
+    async with session.lock:
+        return await compute.run_stateful(_add_edge, session, edge_op, since, full_tree)
+
+def _add_edge(session, edge_op, since, full_tree):
     
     # Compute the global core data
     if edge_op.algo_running == 1:
         # Add the new edge to the timeline
-        TIMELINE.add_change(1, edge_op.source, edge_op.target)
-        return AlgorithmsResponse(core_data=global_core_data, timeline=TIMELINE.root.to_dict())
+        session.timeline.add_change(1, edge_op.source, edge_op.target)
+        return _algorithms_response(session, since, full_tree)
     elif edge_op.algo_running == 0:
         # Add the new edge to the timeline
-        TIMELINE.add_change(1, edge_op.source, edge_op.target)
-        global_core_data = graph_utils.run_all_kcores(list(TIMELINE.graph.edges()))
-        return AlgorithmsResponse(core_data=global_core_data, timeline=TIMELINE.root.to_dict())
+        session.timeline.add_change(1, edge_op.source, edge_op.target)
+        session.core_data = session.timeline.core_data()
+        return _algorithms_response(session, since, full_tree)
     else:
-        TIMELINE.graph.add_edge(edge_op.source, edge_op.target)
-        global_core_data = graph_utils.run_all_kcores(list(TIMELINE.graph.edges()))
-        return AlgorithmsResponse(core_data=global_core_data, timeline=TIMELINE.root.to_dict())
+        session.timeline.cores.insert_edge(edge_op.source, edge_op.target)
+        session.core_data = session.timeline.core_data()
+        return _algorithms_response(session, since, full_tree)
 
 @app.post("/remove_edge", response_model=AlgorithmsResponse)
-async def remove_edge(edge_op: EdgeOperation):
-    global TIMELINE, global_core_data
+async def remove_edge(edge_op: EdgeOperation, session: Session = Depends(get_session),
+                   since: Optional[Tuple[int, int]] = Depends(get_since_revision), full_tree: bool = False):
+    async with session.lock:
+        return await compute.run_stateful(_remove_edge, session, edge_op, since, full_tree)
+
+def _remove_edge(session, edge_op, since, full_tree):
+    if not session.timeline.graph.has_edge(edge_op.source, edge_op.target):
+        raise HTTPException(status_code=400,
+                            detail=f"Edge ({edge_op.source}, {edge_op.target}) does not exist")
     
     # Compute the global core data
     if edge_op.algo_running == 1:
         # Remove the edge from the timeline
-        TIMELINE.add_change(0, edge_op.source, edge_op.target)
-        return AlgorithmsResponse(core_data=global_core_data, timeline=TIMELINE.root.to_dict())
+        session.timeline.add_change(0, edge_op.source, edge_op.target)
+        return _algorithms_response(session, since, full_tree)
     elif edge_op.algo_running == 0:
         # Remove the edge from the timeline
-        TIMELINE.add_change(0, edge_op.source, edge_op.target)
-        global_core_data = graph_utils.run_all_kcores(list(TIMELINE.graph.edges()))
-        return AlgorithmsResponse(core_data=global_core_data, timeline=TIMELINE.root.to_dict())
+        session.timeline.add_change(0, edge_op.source, edge_op.target)
+        session.core_data = session.timeline.core_data()
+        return _algorithms_response(session, since, full_tree)
     else:
-        TIMELINE.graph.remove_edge(edge_op.source, edge_op.target)
-        global_core_data = graph_utils.run_all_kcores(list(TIMELINE.graph.edges()))
-        return AlgorithmsResponse(core_data=global_core_data, timeline=TIMELINE.root.to_dict())
-        
+        session.timeline.cores.remove_edge(edge_op.source, edge_op.target)
+        session.core_data = session.timeline.core_data()
+        return _algorithms_response(session, since, full_tree)
+
+@app.post("/apply_edges", response_model=AlgorithmsResponse)
+async def apply_edges(batch: EdgeBatch, session: Session = Depends(get_session),
+                      since: Optional[Tuple[int, int]] = Depends(get_since_revision), full_tree: bool = False):
+    """
+    Applies a batch of edge additions and removals with a single core update
+    and a single response, following the algo_running modes of /add_edge.
+    """
+    changes = [(op.action, op.source, op.target) for op in batch.operations]
+    async with session.lock:
+        return await compute.run_stateful(_apply_edges, session, changes, batch.algo_running, since, full_tree)
+
+def _apply_edges(session, changes, algo_running, since, full_tree):
+    try:
+        if algo_running in (0, 1):
+            # Record every change as a timeline node
+            session.timeline.apply_changes(changes)
+        else:
+            validate_changes(session.timeline.graph, changes)
+            session.timeline.cores.prepare_batch(len(changes))
+            for action, source, target in changes:
+                if action == 1:
+                    session.timeline.cores.insert_edge(source, target)
+                else:
+                    session.timeline.cores.remove_edge(source, target)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if algo_running != 1:
+        session.core_data = session.timeline.core_data()
+    return _algorithms_response(session, since, full_tree)
 
 @app.get("/get_current_graph", response_model=AlgorithmsResponse)
-async def get_current_graph():
-    global TIMELINE, global_core_data
+async def get_current_graph(request: Request, session: Session = Depends(get_session),
+                            since: Optional[Tuple[int, int]] = Depends(get_since_revision)):
+    # Nothing changed since the client's copy
+    etag = session.timeline.etag()
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, "Vary": CURRENT_GRAPH_VARY})
+
+    async with session.lock:
+        etag = session.timeline.etag()
+        response = await compute.run_stateful(_current_graph, session, since)
+    response.headers["ETag"] = etag
+    response.headers["Vary"] = CURRENT_GRAPH_VARY
+    return response
 
-    # Compute core data for the current graph
-    global_core_data = graph_utils.run_all_kcores(list(TIMELINE.graph.edges()))
-    return AlgorithmsResponse(core_data=global_core_data, timeline=TIMELINE.root.to_dict())
+def _current_graph(session, since):
+    # Core data for the current graph, only recomputed after a mutation
+    session.core_data = session.timeline.core_data()
+    return _algorithms_response(session, since, full_tree=True)
 
 @app.post("/navigate_to_node", response_model=NavigationResponse)
-async def navigate_to_node(node_id: NavigationRequest):
-    global TIMELINE, global_core_data
+async def navigate_to_node(node_id: NavigationRequest, session: Session = Depends(get_session)):
+    async with session.lock:
+        return await compute.run_stateful(_navigate_to_node, session, node_id.node_id, node_id.compress,
+                                          node_id.max_replay)
 
-    target_node = find_node_by_id(TIMELINE.root, node_id.node_id)
+def _navigate_to_node(session, node_id, compress, max_replay=None):
+    target_node = session.timeline.find_node(node_id)
     if not target_node:
         raise HTTPException(status_code=404, detail="Node not found")
 
     # Get the planned path (read-only)
-    raw_sequence = TIMELINE.get_navigation_path(target_node)
+    raw_sequence = session.timeline.get_navigation_path(target_node, compress)
     
     action_sequence = [
         NavigationStep(action=action, source=source, target=target)
         for action, source, target in raw_sequence
     ]
     
+    if max_replay is not None and len(action_sequence) > max_replay:
+        # Too long to replay step by step; restore the node's state here
+        session.timeline.navigate(target_node)
+        session.core_data = session.timeline.core_data()
+        return NavigationResponse(action_sequence=action_sequence, applied=True,
+                                  core_data=session.core_data)
+
     # Execute the navigation (modifies state)
-    TIMELINE.current_node = target_node
+    session.timeline.move_to(target_node)
     
     # Return both results
     return NavigationResponse(
         action_sequence=action_sequence
     )
 
+@app.get("/core_data_at/{node_id}", response_model=CoreDataAtResponse)
+async def get_core_data_at(node_id: int, session: Session = Depends(get_session)):
+    """
+    Core data of the graph at any timeline node, without moving the current
+    node. Older states are decomposed from a scratch copy of the graph.
+    """
+    async with session.lock:
+        core_data, edges, fingerprint = await compute.run_stateful(_core_data_at, session, node_id)
+    if core_data is None:
+        # Pure function of the edge snapshot; may run in a worker process
+        core_data = await compute.run(graph_utils.run_all_kcores, edges)
+        async with session.lock:
+            session.timeline.store_result("core_data", core_data, node_id, fingerprint)
+    return CoreDataAtResponse(node_id=node_id, core_data=core_data)
+
+def _core_data_at(session, node_id):
+    """
+    Core data of a node when it is known, otherwise a snapshot of the node's
+    edges and its graph fingerprint to compute it from
+    """
+    timeline = session.timeline
+    node = timeline.find_node(node_id)
+    if not node:
+        raise HTTPException(status_code=404, detail="Node not found")
+    if node == timeline.current_node and timeline.cores.fingerprint == node.fingerprint:
+        # The live graph is in the node's state; reuse its maintained cores
+        return timeline.core_data(), None, None
+    core_data = timeline.result_at(node, "core_data")
+    if core_data is not None:
+        return core_data, None, None
+    return None, list(timeline.graph_at(node).edges()), node.fingerprint
+
+@app.get("/timeline/subtree", response_model=SubtreeResponse)
+async def get_timeline_subtree(root: int = 1, depth: int = Query(default=20, ge=0, le=100),
+                               max_siblings: int = Query(default=20, ge=1), offset: int = Query(default=0, ge=0),
+                               session: Session = Depends(get_session)):
+    """
+    Part of the timeline tree for clients that expand it lazily: depth
+    levels below root, at most max_siblings children per node (from offset
+    for the root), always including the way to the current node, with a
+    window of the tree around it when it lies deeper (see TimeLine.subtree).
+    """
+    async with session.lock:
+        return await compute.run_stateful(_timeline_subtree, session, root, depth, max_siblings, offset)
+
+def _timeline_subtree(session, root_id, depth, max_siblings, offset):
+    timeline = session.timeline
+    root = timeline.find_node(root_id)
+    if not root:
+        raise HTTPException(status_code=404, detail="Node not found")
+    subtree = timeline.subtree(root, depth, max_siblings, offset)
+    response = SubtreeResponse(timeline_id=timeline.uid, revision=timeline.revision,
+                               current_node=timeline.current_node.id, subtree={})
+    # Nested deeper than the model serializer supports
+    content = response.model_dump_json(exclude={"subtree"})
+    content = content[:-1] + ',"subtree":' + json.dumps(subtree) + '}'
+    return Response(content=content, media_type="application/json")
+
+@app.get("/timeline/diff", response_model=TimelineDiffResponse)
+async def get_timeline_diff(from_id: int = Query(alias="from"), to_id: int = Query(alias="to"),
+                            session: Session = Depends(get_session)):
+    """
+    Net edge diff between the graphs at two timeline nodes, without moving
+    the current node.
+    """
+    async with session.lock:
+        return await compute.run_stateful(_timeline_diff, session, from_id, to_id)
+
+def _timeline_diff(session, from_id, to_id):
+    from_node = session.timeline.find_node(from_id)
+    to_node = session.timeline.find_node(to_id)
+    if not from_node or not to_node:
+        raise HTTPException(status_code=404, detail="Node not found")
+    added, removed = session.timeline.diff(from_node, to_node)
+    return TimelineDiffResponse(added=added, removed=removed)
+
 @app.post("/upload_graph", response_model=AlgorithmsResponse)
-async def upload_graph(edges: EdgeList):
+async def upload_graph(edges: EdgeList, session: Session = Depends(get_session), full_tree: bool = False):
     """
     Upload a graph and compute its k-core structure.
     """
-    global TIMELINE, global_core_data
-
-    TIMELINE = TimeLine()
-    
-    # Add all edges directly to graph (no timeline recording)
-    for u, v in edges.edges:
-        TIMELINE.graph.add_edge(u, v)
-    
-    # Compute core data
-    global_core_data = graph_utils.run_all_kcores(edges.edges)
-    
-    # Return response with empty timeline (root has no children)
-    return AlgorithmsResponse(
-        core_data=global_core_data,
-        timeline=TIMELINE.root.to_dict()  # Will show empty root node
-    )
+    async with session.lock:
+        return await compute.run_stateful(_load_graph, session, edges.edges, full_tree)
 
 @app.get("/polygon", response_model=PolygonResponse)
-async def get_truss_data():
+async def get_truss_data(session: Session = Depends(get_session)):
+    async with session.lock:
+        timeline = session.timeline
+        version = timeline.version
+        truss_data = POLYGON_CACHE.get(version)
+        if truss_data is None:
+            # Computed before for this graph at the current timeline node
+            truss_data = timeline.cached_result("polygon")
+        if truss_data is None:
+            edges = list(timeline.graph.edges())
+            node_id, fingerprint = timeline.current_node.id, timeline.cores.fingerprint
+        else:
+            POLYGON_CACHE.put(version, truss_data)
+    if truss_data is None:
+        # Pure function of the edge snapshot; may run in a worker process
+        truss_data = await compute.run(graph_utils.run_all_ktrusses, edges)
+        POLYGON_CACHE.put(version, truss_data)
+        async with session.lock:
+            timeline.store_result("polygon", truss_data, node_id, fingerprint)
     polygon_data = {
-        k: PolygonLevel(root=v) for k, v in graph_utils.run_all_ktrusses(TIMELINE.graph.edges()).items()
+        k: PolygonLevel(root=v) for k, v in truss_data.items()
     }
     return PolygonResponse(polygon_data=polygon_data)
\ No newline at end of file
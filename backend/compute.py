@@ -0,0 +1,54 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# "thread" or "process": where pure graph computations such as the truss
+# decomposition run. Work on live TimeLine state always runs on threads.
+COMPUTE_EXECUTOR = os.environ.get("COMPUTE_EXECUTOR", "thread")
+COMPUTE_WORKERS = int(os.environ.get("COMPUTE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_thread_executor = None
+_process_executor = None
+
+def _get_thread_executor():
+    global _thread_executor
+    if _thread_executor is None:
+        _thread_executor = ThreadPoolExecutor(max_workers=COMPUTE_WORKERS, thread_name_prefix="compute")
+    return _thread_executor
+
+def _get_process_executor():
+    global _process_executor
+    if _process_executor is None:
+        _process_executor = ProcessPoolExecutor(max_workers=COMPUTE_WORKERS)
+    return _process_executor
+
+async def run(func, *args):
+    """
+    Runs a pure function of its (picklable) arguments on the configured
+    compute executor without blocking the event loop.
+    """
+    if COMPUTE_EXECUTOR == "process":
+        executor = _get_process_executor()
+    else:
+        executor = _get_thread_executor()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+async def run_stateful(func, *args):
+    """
+    Runs a function that reads or mutates in-process state, such as a
+    TimeLine, on the compute thread pool. Callers serialize access to that
+    state themselves.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_thread_executor(), functools.partial(func, *args))
+
+def shutdown():
+    global _thread_executor, _process_executor
+    if _thread_executor is not None:
+        _thread_executor.shutdown()
+        _thread_executor = None
+    if _process_executor is not None:
+        _process_executor.shutdown()
+        _process_executor = None
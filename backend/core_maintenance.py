@@ -0,0 +1,260 @@
+import itertools
+import networkx as nx
+from collections import defaultdict
+import graph_utils
+
+# Graph versions are unique across maintainers so that results cached for
+# one timeline can never be served for another
+_versions = itertools.count(1)
+
+# Batches larger than this fraction of the graph's edges are recomputed once
+# instead of maintained edge by edge
+BATCH_RECOMPUTE_RATIO = 0.1
+BATCH_RECOMPUTE_MIN = 64
+
+def _edge_hash(u, v):
+    return hash(frozenset((u, v)))
+
+class CoreMaintainer:
+    """
+    Keeps a live core number map and the per-level core data for a graph
+    that is mutated one edge at a time. Insertions and deletions only revisit
+    the subcore reachable from the lower-core endpoint of the changed edge.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.core = {}
+        self.directions = set()  # Original (source, target) direction of every edge
+        self.level_nodes = defaultdict(set)  # core number -> nodes
+        self.level_edges = defaultdict(set)  # lower endpoint core number -> edges
+        self.selfloops = 0
+        self.valid = False
+        self.version = next(_versions)  # Changes on every graph mutation
+        self.fingerprint = 0  # XOR of the edge hashes; equal for equal edge sets
+        self.cached_version = None  # Version the memoized core data belongs to
+        self.cached_core_data = None
+
+    def invalidate(self):
+        """Drop the live state; the next read recomputes it from scratch."""
+        self.valid = False
+
+    def prepare_batch(self, size):
+        """
+        Called before applying size edge changes in a row. Large batches skip
+        per-edge maintenance and are recomputed once on the next read.
+        """
+        threshold = max(BATCH_RECOMPUTE_MIN, BATCH_RECOMPUTE_RATIO * self.graph.number_of_edges())
+        if size > threshold:
+            self.invalidate()
+
+    def load(self, edges):
+        """Adds edges in bulk and runs one full decomposition."""
+        for u, v in edges:
+            if not self.graph.has_edge(u, v):
+                self.fingerprint ^= _edge_hash(u, v)
+            self.graph.add_edge(u, v)
+            self._record_direction(u, v)
+        self.version = next(_versions)
+        self.rebuild()
+
+    def restore(self, nodes, edges):
+        """
+        Replaces the graph by the given nodes and oriented edges. The
+        decomposition is recomputed on the next read.
+        """
+        edges = list(edges)
+        self.graph.clear()
+        self.graph.add_nodes_from(nodes)
+        self.graph.add_edges_from(edges)
+        self.directions = set(edges)
+        self.fingerprint = 0
+        for u, v in edges:
+            self.fingerprint ^= _edge_hash(u, v)
+        self.selfloops = nx.number_of_selfloops(self.graph)
+        self.version = next(_versions)
+        self.invalidate()
+
+    def rebuild(self):
+        self.core = graph_utils.get_core_number(self.graph)
+        self.selfloops = nx.number_of_selfloops(self.graph)
+        self.level_nodes = defaultdict(set)
+        self.level_edges = defaultdict(set)
+        for v, k in self.core.items():
+            if k >= 1:
+                self.level_nodes[k].add(v)
+        for u, v in self.graph.edges():
+            k = min(self.core[u], self.core[v])
+            if k >= 1:
+                self.level_edges[k].add(self._oriented(u, v))
+        self.valid = True
+
+    def remember(self, core_data):
+        """Memoizes core data known to belong to the current graph"""
+        self.cached_core_data = core_data
+        self.cached_version = self.version
+
+    def core_data(self):
+        """
+        Returns the core data in the format produced by run_all_kcores. The
+        result is memoized until the next graph mutation and must not be
+        modified by callers.
+        """
+        if self.cached_version == self.version:
+            return self.cached_core_data
+        if not self.valid:
+            self.rebuild()
+        self.cached_core_data = self._materialize()
+        self.cached_version = self.version
+        return self.cached_core_data
+
+    def _materialize(self):
+        if not self.level_nodes:
+            return {}
+
+        levels = sorted(self.level_nodes, reverse=True)
+        max_k = levels[0]
+        core_data = {
+            max_k: {
+                'nodes': list(self.level_nodes[max_k]),
+                'edges': list(self.level_edges.get(max_k, ())),
+                'pruned_edges': []
+            }
+        }
+        # Below the top level, the pruned edges are exactly the level's edges
+        for k in levels[1:]:
+            edges = self.level_edges.get(k, ())
+            core_data[k] = {
+                'nodes': list(self.level_nodes[k]),
+                'edges': list(edges),
+                'pruned_edges': list(edges)
+            }
+        return core_data
+
+    def insert_edge(self, u, v):
+        if self.graph.has_edge(u, v):
+            return
+        self.graph.add_edge(u, v)
+        self._record_direction(u, v)
+        self.fingerprint ^= _edge_hash(u, v)
+        self.version = next(_versions)
+        if u == v:
+            self.selfloops += 1
+        if not self.valid:
+            return
+        if self.selfloops:
+            # Self-loops inflate degrees in get_core_number; fall back to it
+            self.invalidate()
+            return
+
+        core = self.core
+        adj = self.graph.adj
+        core.setdefault(u, 0)
+        core.setdefault(v, 0)
+        k = min(core[u], core[v])
+
+        # Only the k-subcore reachable from the lower-core endpoint can change
+        roots = [w for w in (u, v) if core[w] == k]
+        subcore = set(roots)
+        stack = list(roots)
+        while stack:
+            w = stack.pop()
+            for x in adj[w]:
+                if core[x] == k and x not in subcore:
+                    subcore.add(x)
+                    stack.append(x)
+
+        # Evict nodes that cannot have k+1 neighbours in a (k+1)-core
+        core_degree = {w: sum(1 for x in adj[w] if core[x] >= k) for w in subcore}
+        evicted = set(w for w in subcore if core_degree[w] <= k)
+        stack = list(evicted)
+        while stack:
+            w = stack.pop()
+            for x in adj[w]:
+                if x in subcore and x not in evicted:
+                    core_degree[x] -= 1
+                    if core_degree[x] <= k:
+                        evicted.add(x)
+                        stack.append(x)
+
+        promoted = subcore - evicted
+        for w in promoted:
+            core[w] = k + 1
+        self._relevel({w: k for w in promoted})
+        self._add(self.level_edges, min(core[u], core[v]), self._oriented(u, v))
+
+    def remove_edge(self, u, v):
+        self.graph.remove_edge(u, v)
+        edge = self._oriented(u, v)
+        self.directions.discard(edge)
+        self.fingerprint ^= _edge_hash(u, v)
+        self.version = next(_versions)
+        if u == v:
+            self.selfloops -= 1
+        if not self.valid:
+            return
+        if self.selfloops or u == v:
+            self.invalidate()
+            return
+
+        core = self.core
+        adj = self.graph.adj
+        k = min(core[u], core[v])
+        self._discard(self.level_edges, k, edge)
+
+        # Only the k-subcore reachable from the lower-core endpoint can drop,
+        # and only nodes next to a dropped node need to be looked at
+        core_degree = {}
+        dropped = set()
+        stack = [w for w in (u, v) if core[w] == k]
+        while stack:
+            w = stack.pop()
+            if w in dropped:
+                continue
+            if w not in core_degree:
+                core_degree[w] = sum(1 for x in adj[w] if core[x] >= k)
+            if core_degree[w] < k:
+                dropped.add(w)
+                core[w] = k - 1
+                for x in adj[w]:
+                    if core[x] == k:
+                        if x in core_degree:
+                            core_degree[x] -= 1
+                        stack.append(x)
+
+        self._relevel({w: k for w in dropped})
+
+    def _record_direction(self, u, v):
+        if (v, u) not in self.directions:
+            self.directions.add((u, v))
+
+    def _oriented(self, u, v):
+        return (u, v) if (u, v) in self.directions else (v, u)
+
+    def _relevel(self, old_core):
+        """Moves the nodes whose core number changed, and their edges, between levels."""
+        core = self.core
+        for w, old in old_core.items():
+            new = core[w]
+            self._discard(self.level_nodes, old, w)
+            self._add(self.level_nodes, new, w)
+            for x in self.graph.adj[w]:
+                old_k = min(old, old_core.get(x, core[x]))
+                new_k = min(new, core[x])
+                if old_k != new_k:
+                    edge = self._oriented(w, x)
+                    self._discard(self.level_edges, old_k, edge)
+                    self._add(self.level_edges, new_k, edge)
+
+    @staticmethod
+    def _add(levels, k, item):
+        if k >= 1:
+            levels[k].add(item)
+
+    @staticmethod
+    def _discard(levels, k, item):
+        bucket = levels.get(k)
+        if bucket is not None:
+            bucket.discard(item)
+            if not bucket:
+                del levels[k]
@@ -0,0 +1,82 @@
+from array import array
+
+class CSRGraph:
+    """
+    Compressed sparse row adjacency of an undirected networkx graph. Nodes are
+    relabelled to dense ids 0..n-1; the neighbours of id i are
+    indices[indptr[i]:indptr[i+1]].
+    """
+
+    def __init__(self, G):
+        self.nodes = list(G)  # Dense id -> original node
+        index = {v: i for i, v in enumerate(self.nodes)}
+        self.indptr = array('q', [0])
+        self.indices = array('q')
+        self.degree = array('q')
+        adj = G.adj
+        lookup = index.__getitem__
+        for v in self.nodes:
+            nbrs = adj[v]
+            self.indices.extend(map(lookup, nbrs))
+            self.indptr.append(len(self.indices))
+            # Self-loops count twice, as in G.degree()
+            self.degree.append(len(nbrs) + (1 if v in nbrs else 0))
+
+    def __len__(self):
+        return len(self.nodes)
+
+def get_core_number(csr):
+    """
+    Batagelj-Zaversnik peeling over a CSR graph. Nodes are kept in an array
+    sorted by current degree, and moving a node to the next lower bin is a
+    constant-time swap with the first node of its bin.
+    """
+    n = len(csr)
+    if n == 0:
+        return {}
+    indptr, indices = csr.indptr, csr.indices
+    deg = array('q', csr.degree)
+    max_deg = max(deg)
+
+    # Bin start offsets of the nodes sorted by degree
+    bin_start = array('q', bytes(8 * (max_deg + 1)))
+    for d in deg:
+        bin_start[d] += 1
+    start = 0
+    for d in range(max_deg + 1):
+        count = bin_start[d]
+        bin_start[d] = start
+        start += count
+
+    pos = array('q', bytes(8 * n))
+    vert = array('q', bytes(8 * n))
+    for v in range(n):
+        d = deg[v]
+        pos[v] = bin_start[d]
+        vert[pos[v]] = v
+        bin_start[d] += 1
+    # Restore the bin starts shifted by the placement pass
+    for d in range(max_deg, 0, -1):
+        bin_start[d] = bin_start[d - 1]
+    bin_start[0] = 0
+
+    for i in range(n):
+        v = vert[i]
+        dv = deg[v]
+        for u in indices[indptr[v]:indptr[v + 1]]:
+            du = deg[u]
+            if du > dv:
+                # Swap u with the first node of its bin, then shrink the bin
+                pu = pos[u]
+                pw = bin_start[du]
+                w = vert[pw]
+                if u != w:
+                    pos[u] = pw
+                    vert[pw] = u
+                    pos[w] = pu
+                    vert[pu] = w
+                bin_start[du] += 1
+                deg[u] = du - 1
+
+    nodes = csr.nodes
+    return {nodes[v]: deg[v] for v in range(n)}
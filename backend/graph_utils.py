@@ -1,5 +1,21 @@
+import os
 import networkx as nx
 from collections import defaultdict
+import csr_graph
+import numpy_kcore
+
+# Graphs with more edges than this are peeled over a CSR copy
+CSR_EDGE_THRESHOLD = 20000
+# Graphs with more edges than this go through the vectorized NumPy engine
+NUMPY_EDGE_THRESHOLD = 200000
+# Worker processes for the parallel h-index decomposition of graphs above the
+# NumPy threshold; 0 or 1 keeps the decomposition in-process
+PARALLEL_WORKERS = int(os.environ.get("KCORE_PARALLEL_WORKERS", "0"))
+
+def set_parallel_workers(workers):
+    """Selects the parallel decomposition mode (workers > 1) or turns it off."""
+    global PARALLEL_WORKERS
+    PARALLEL_WORKERS = workers
 
 def generate_graph(edges):
     G = nx.Graph()
@@ -7,6 +23,14 @@ def generate_graph(edges):
     return G
 
 def get_core_number(G):
+    if G.number_of_edges() > NUMPY_EDGE_THRESHOLD:
+        # Isolated nodes do not appear in the edge list
+        core = dict.fromkeys(G, 0)
+        core.update(numpy_kcore.get_core_number(G.edges(), PARALLEL_WORKERS))
+        return core
+    if G.number_of_edges() > CSR_EDGE_THRESHOLD:
+        return csr_graph.get_core_number(csr_graph.CSRGraph(G))
+
     degrees = dict(G.degree())
     nodes = sorted(degrees, key=degrees.get)
     bin_boundaries = [0]
@@ -45,93 +69,77 @@ def get_kcore(G, k=None, core_number=None):
 
     return get_core_subgraph(G, k_filter, k, core_number)
 
-def run_all_kcores(edges):
-    # Step 1: Initialize with original edge directions
-    G = generate_graph(edges)
-    original_edges = set((u, v) for u, v in edges)  # Store original directions
-    
-    all_cores = {}
-    k = 1
-    
-    # Step 2-12: Compute all k-cores while preserving edge directions
-    while True:
-        k_core = get_kcore(G, k)
-        edges_in_core = list(k_core.edges())
-        
-        if not edges_in_core:
-            break
-            
-        # Preserve original edge directions
-        directed_edges = set()
-        for u, v in edges_in_core:
-            if (u, v) in original_edges:
-                directed_edges.add((u, v))
-            else:
-                directed_edges.add((v, u))
-        
-        all_cores[k] = {
-            'nodes': set(k_core.nodes()),
-            'edges': directed_edges  # Now using ordered tuples
-        }
-        k += 1
-    
-    if not all_cores:
+def build_core_levels(G, core, original_edges):
+    """
+    Builds the per-level core data from a core number map in a single pass.
+    Nodes are bucketed by core number and every edge is assigned to the level
+    of its lower-core endpoint, preserving the original edge directions.
+    """
+    if not core:
         return {}
-    
-    # Step 13-21: Process cores with consistent edge directions
-    final_cores = {}
-    max_k = max(all_cores.keys())
-    pruning_data = {k: {'nodes': set(), 'edges': set()} for k in all_cores}
-    
+    max_k = max(core.values())
+    if max_k < 1:
+        return {}
+
+    level_nodes = defaultdict(list)
+    for v, k in core.items():
+        level_nodes[k].append(v)
+
+    level_edges = defaultdict(list)
+    level_pruned = defaultdict(set)
+    for u, v in G.edges():
+        core_u, core_v = core[u], core[v]
+        k = min(core_u, core_v)
+        if k < 1:
+            continue
+
+        # Preserve original edge direction
+        edge = (u, v) if (u, v) in original_edges else (v, u)
+        level_edges[k].append(edge)
+
+        if k == max_k:
+            continue
+        # An edge is pruned at level k when one of its endpoints leaves the
+        # graph at k, oriented from that endpoint when the input allows it
+        pruned = level_pruned[k]
+        if core_u == k:
+            pruned.add((u, v) if (u, v) in original_edges else (v, u))
+        if core_v == k:
+            pruned.add((v, u) if (v, u) in original_edges else (u, v))
+        if core_u == core_v:
+            pruned.add(edge)
+
     # Highest core
-    final_cores[max_k] = {
-        'nodes': list(all_cores[max_k]['nodes']),
-        'edges': list(all_cores[max_k]['edges']),  # Already ordered
-        'pruned_edges': []
+    final_cores = {
+        max_k: {
+            'nodes': level_nodes[max_k],
+            'edges': level_edges[max_k],
+            'pruned_edges': []
+        }
     }
-    
+
     # Lower cores
     for k in range(max_k-1, 0, -1):
-        current_nodes = all_cores[k]['nodes']
-        current_edges = all_cores[k]['edges']
-        higher_nodes = all_cores[k+1]['nodes']
-        higher_edges = all_cores[k+1]['edges']
-        
-        unique_nodes = current_nodes - higher_nodes
-        unique_edges = current_edges - higher_edges
-        
-        pruned_nodes = current_nodes - higher_nodes
-        pruned_edges = set()
-        
-        for node in pruned_nodes:
-            for neighbor in G.neighbors(node):
-                if neighbor in current_nodes:
-                    # Check original edge direction
-                    if (node, neighbor) in original_edges:
-                        pruned_edges.add((node, neighbor))
-                    elif (neighbor, node) in original_edges:
-                        pruned_edges.add((neighbor, node))
-        
-        for u, v in current_edges:
-            if u in pruned_nodes and v in pruned_nodes:
-                # Maintain original direction
-                if (u, v) in original_edges:
-                    pruned_edges.add((u, v))
-                else:
-                    pruned_edges.add((v, u))
-        
-        pruning_data[k]['nodes'] = pruned_nodes
-        pruning_data[k]['edges'] = pruned_edges
-        
-        if unique_nodes:
+        if level_nodes[k]:
             final_cores[k] = {
-                'nodes': list(unique_nodes),
-                'edges': list(unique_edges),
-                'pruned_edges': list(pruned_edges)
+                'nodes': level_nodes[k],
+                'edges': level_edges[k],
+                'pruned_edges': list(level_pruned[k])
             }
-    
+
     return final_cores
 
+def run_all_kcores(edges):
+    if len(edges) > NUMPY_EDGE_THRESHOLD:
+        return numpy_kcore.run_all_kcores(edges, PARALLEL_WORKERS)
+
+    G = generate_graph(edges)
+    original_edges = set((u, v) for u, v in edges)  # Store original directions
+
+    # Peel once and bucket every level from the core numbers
+    core = get_core_number(G)
+    return build_core_levels(G, core, original_edges)
+
 def get_affected_region(G, node=None, edge=None, radius=2):
     affected_nodes = set()
     
@@ -161,6 +169,49 @@ def update_core_data(old_core_data, affected_nodes, new_local_core_data):
     
     return updated_core_data
 
+def get_truss_number(G):
+    """
+    Support-based truss decomposition. Triangles are counted once per edge,
+    then edges are peeled from buckets in increasing order of support.
+    Returns the edges and their trussness, i.e. the largest k such that the
+    edge belongs to the k-truss.
+    """
+    adj = {v: set(G.adj[v]) - {v} for v in G}
+    edges = [(u, v) for u, v in G.edges() if u != v]
+    edge_id = {v: {} for v in adj}
+    for i, (u, v) in enumerate(edges):
+        edge_id[u][v] = edge_id[v][u] = i
+
+    support = [len(adj[u] & adj[v]) for u, v in edges]
+    buckets = defaultdict(set)
+    for i, s in enumerate(support):
+        buckets[s].add(i)
+
+    truss = [0] * len(edges)
+    level = 0
+    for _ in range(len(edges)):
+        while not buckets[level]:
+            level += 1
+        i = buckets[level].pop()
+        u, v = edges[i]
+        truss[i] = level + 2
+
+        # Every triangle through (u, v) loses one supporting edge
+        if len(adj[u]) > len(adj[v]):
+            u, v = v, u
+        for w in adj[u]:
+            if w in adj[v]:
+                for f in (edge_id[u][w], edge_id[v][w]):
+                    s = support[f]
+                    if s > level:
+                        buckets[s].remove(f)
+                        buckets[s - 1].add(f)
+                        support[f] = s - 1
+        adj[u].discard(v)
+        adj[v].discard(u)
+
+    return edges, truss
+
 def run_all_ktrusses(edges):
     G = nx.Graph(edges)
     polygon_data = defaultdict(list)
@@ -179,23 +230,38 @@ def run_all_ktrusses(edges):
             if len(component) >= 3:  # Only include meaningful components
                 polygon_data[0].append({"nodes": sorted(component)})
     
-    # Then process k-trusses as before
-    k = 1
-    while True:
-        try:
-            truss = nx.k_truss(G, k+2)
-            if truss.number_of_edges() == 0:
-                break
-                
-            components = sorted(nx.connected_components(truss), 
-                             key=lambda x: -len(x))
-            
-            for component in components:
-                if len(component) >= 3:
-                    polygon_data[k].append({"nodes": sorted(component)})
-            
-            k += 1
-        except:
-            break
+    # Then group every k-truss into components from one truss decomposition
+    edges, truss = get_truss_number(G)
+    truss_edges = defaultdict(list)
+    for edge, t in zip(edges, truss):
+        if t >= 3:
+            truss_edges[t].append(edge)
+
+    # Union-find over the edges added from the densest truss downwards
+    parent = {}
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    truss_levels = {}
+    for t in range(max(truss_edges, default=2), 2, -1):
+        for u, v in truss_edges[t]:
+            parent.setdefault(u, u)
+            parent.setdefault(v, v)
+            root_u, root_v = find(u), find(v)
+            if root_u != root_v:
+                parent[root_u] = root_v
+
+        groups = defaultdict(list)
+        for node in parent:
+            groups[find(node)].append(node)
+        components = sorted(groups.values(), key=lambda x: -len(x))
+        truss_levels[t - 2] = [{"nodes": sorted(component)}
+                               for component in components if len(component) >= 3]
+
+    for k in sorted(truss_levels):
+        polygon_data[k].extend(truss_levels[k])
     
     return dict(polygon_data)
\ No newline at end of file
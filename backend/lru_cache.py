@@ -0,0 +1,54 @@
+from collections import OrderedDict
+
+class LRUCache:
+    """
+    A bounded mapping that evicts the least recently used entry once it holds
+    more than maxsize entries. With a weigh function, entries are also
+    evicted while their total weight exceeds maxweight.
+    """
+
+    def __init__(self, maxsize=32, maxweight=None, weigh=None):
+        self.maxsize = maxsize
+        self.maxweight = maxweight
+        self.weigh = weigh
+        self.weight = 0
+        self.entries = OrderedDict()
+        self.weights = {}
+
+    def get(self, key, default=None):
+        if key not in self.entries:
+            return default
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        if self.weigh is not None:
+            self.weight -= self.weights.pop(key, 0)
+            weight = self.weigh(value)
+            if self.maxweight is not None and weight > self.maxweight:
+                # Would evict everything else and still not fit
+                self.entries.pop(key, None)
+                return
+            self.weights[key] = weight
+            self.weight += weight
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize or (
+                self.maxweight is not None and self.weight > self.maxweight):
+            evicted, _ = self.entries.popitem(last=False)
+            self.weight -= self.weights.pop(evicted, 0)
+
+    def pop(self, key, default=None):
+        self.weight -= self.weights.pop(key, 0)
+        return self.entries.pop(key, default)
+
+    def clear(self):
+        self.entries.clear()
+        self.weights.clear()
+        self.weight = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
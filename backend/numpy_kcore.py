@@ -0,0 +1,151 @@
+import numpy as np
+import parallel_kcore
+
+def edge_array(edges):
+    """Returns the edges as an (m, 2) int64 array."""
+    return np.asarray(list(edges), dtype=np.int64).reshape(-1, 2)
+
+def build_csr(edges):
+    """
+    Relabels the nodes of an (m, 2) edge array to dense ids and builds the
+    CSR adjacency. Duplicate edges are dropped in order of first occurrence;
+    an edge given in both directions points away from the endpoint that
+    appears first in the input, as in G.edges().
+    Returns (labels, unique edges as ids, whether each was also given
+    reversed, indptr, indices).
+    """
+    labels, first, ids = np.unique(edges, return_index=True, return_inverse=True)
+    ids = ids.reshape(-1, 2)
+    n = len(labels)
+
+    lo = np.minimum(ids[:, 0], ids[:, 1])
+    hi = np.maximum(ids[:, 0], ids[:, 1])
+    _, rows, group, counts = np.unique(lo * n + hi, return_index=True, return_inverse=True, return_counts=True)
+    ascending = np.bincount(group, weights=ids[:, 0] <= ids[:, 1], minlength=len(rows))
+    reverse = (ascending > 0) & (ascending < counts)
+    order = np.argsort(rows)
+    ids, reverse = ids[rows[order]], reverse[order]
+    swap = reverse & (first[ids[:, 1]] < first[ids[:, 0]])
+    ids[swap] = ids[swap][:, ::-1]
+
+    # Both directions of every edge; a self-loop shows up twice, as in G.degree()
+    src = np.concatenate([ids[:, 0], ids[:, 1]])
+    dst = np.concatenate([ids[:, 1], ids[:, 0]])
+    indices = dst[np.argsort(src, kind='stable')]
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return labels, ids, reverse, indptr, indices
+
+def _gather_neighbors(indptr, indices, frontier):
+    """Concatenated neighbour lists of the frontier nodes."""
+    starts = indptr[frontier]
+    lens = indptr[frontier + 1] - starts
+    offsets = np.repeat(starts - (np.cumsum(lens) - lens), lens)
+    return indices[offsets + np.arange(lens.sum())]
+
+def peel(indptr, indices):
+    """
+    Computes core numbers by peeling whole frontiers at once: every alive node
+    with degree <= k is removed together and its alive neighbours lose one
+    degree per removed edge. Only those neighbours can join the next frontier.
+    """
+    n = len(indptr) - 1
+    deg = np.diff(indptr)
+    core = np.zeros(n, dtype=np.int64)
+    alive = np.ones(n, dtype=bool)
+    remaining = n
+    k = 0
+    while remaining:
+        frontier = np.flatnonzero(alive & (deg <= k))
+        if not frontier.size:
+            k = deg[alive].min()
+            continue
+        while frontier.size:
+            alive[frontier] = False
+            core[frontier] = k
+            remaining -= frontier.size
+            nbrs = _gather_neighbors(indptr, indices, frontier)
+            nbrs = nbrs[alive[nbrs]]
+            if not nbrs.size:
+                break
+            np.subtract.at(deg, nbrs, 1)
+            candidates = np.unique(nbrs)
+            frontier = candidates[deg[candidates] <= k]
+    return core
+
+def _core_array(indptr, indices, workers):
+    if workers > 1:
+        return parallel_kcore.get_core_number(indptr, indices, workers)
+    return peel(indptr, indices)
+
+def get_core_number(edges, workers=0):
+    """
+    Core number of every node that appears in edges. With more than one
+    worker the decomposition runs on a process pool.
+    """
+    edges = edge_array(edges)
+    if not len(edges):
+        return {}
+    labels, _, _, indptr, indices = build_csr(edges)
+    return dict(zip(labels.tolist(), _core_array(indptr, indices, workers).tolist()))
+
+def run_all_kcores(edges, workers=0):
+    """
+    Vectorized equivalent of graph_utils.run_all_kcores for integer-labelled
+    edge lists.
+    """
+    edges = edge_array(edges)
+    if not len(edges):
+        return {}
+    labels, ids, reverse, indptr, indices = build_csr(edges)
+    core = _core_array(indptr, indices, workers)
+    max_k = int(core.max())
+    if max_k < 1:
+        return {}
+
+    # Group nodes by core number and edges by their lower endpoint's core number
+    node_order = np.argsort(core, kind='stable')
+    node_levels, node_starts = np.unique(core[node_order], return_index=True)
+    node_groups = dict(zip(node_levels.tolist(), np.split(labels[node_order], node_starts[1:])))
+
+    def group_edges(pairs, levels):
+        order = np.argsort(levels, kind='stable')
+        values, starts = np.unique(levels[order], return_index=True)
+        return dict(zip(values.tolist(), np.split(labels[pairs[order]], starts[1:])))
+
+    core_a, core_b = core[ids[:, 0]], core[ids[:, 1]]
+    edge_core = np.minimum(core_a, core_b)
+    edge_groups = group_edges(ids, edge_core)
+
+    # An edge is pruned at its level from the endpoint that leaves there, in
+    # each direction the input gives it from that endpoint, else as given
+    forward = ~(reverse & (core_b < core_a))
+    backward = reverse & (core_b <= core_a)
+    pruned_groups = group_edges(np.concatenate([ids[forward], ids[backward][:, ::-1]]),
+                                np.concatenate([edge_core[forward], edge_core[backward]]))
+
+    def level_edges(k, groups=edge_groups):
+        group = groups.get(k)
+        if group is None:
+            return []
+        return list(zip(group[:, 0].tolist(), group[:, 1].tolist()))
+
+    # Highest core
+    final_cores = {
+        max_k: {
+            'nodes': node_groups[max_k].tolist(),
+            'edges': level_edges(max_k),
+            'pruned_edges': []
+        }
+    }
+
+    # Lower cores
+    for k in range(max_k-1, 0, -1):
+        if k in node_groups:
+            final_cores[k] = {
+                'nodes': node_groups[k].tolist(),
+                'edges': level_edges(k),
+                'pruned_edges': level_edges(k, pruned_groups)
+            }
+
+    return final_cores
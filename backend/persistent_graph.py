@@ -0,0 +1,276 @@
+# Hash array mapped trie parameters: every level consumes 5 bits of the
+# 64-bit key hash and holds up to 32 entries
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_MASK = (1 << 64) - 1
+_SUB = object()  # Marks a slot that holds a child node instead of a key
+
+def _hash(key):
+    return hash(key) & _HASH_MASK
+
+def _popcount(x):
+    return bin(x).count("1")
+
+class _Node:
+    """
+    Trie node: for every set bit of bitmap, array holds a key and its value,
+    or _SUB and a child node.
+    """
+    __slots__ = ("bitmap", "array")
+
+    def __init__(self, bitmap, array):
+        self.bitmap = bitmap
+        self.array = array
+
+class _Collision:
+    """Keys whose 64-bit hashes are all equal, as flat key, value pairs"""
+    __slots__ = ("array",)
+
+    def __init__(self, array):
+        self.array = array
+
+_EMPTY_NODE = _Node(0, ())
+
+def _get(node, h, key, default):
+    shift = 0
+    while True:
+        if isinstance(node, _Collision):
+            array = node.array
+            for i in range(0, len(array), 2):
+                if array[i] == key:
+                    return array[i + 1]
+            return default
+        bit = 1 << ((h >> shift) & _MASK)
+        if not node.bitmap & bit:
+            return default
+        i = 2 * _popcount(node.bitmap & (bit - 1))
+        k = node.array[i]
+        if k is _SUB:
+            node = node.array[i + 1]
+            shift += _BITS
+        elif k == key:
+            return node.array[i + 1]
+        else:
+            return default
+
+def _merge(shift, h1, k1, v1, h2, k2, v2):
+    """Smallest subtrie holding two keys whose hashes agree below shift"""
+    if shift >= 64:
+        return _Collision((k1, v1, k2, v2))
+    i1 = (h1 >> shift) & _MASK
+    i2 = (h2 >> shift) & _MASK
+    if i1 == i2:
+        return _Node(1 << i1, (_SUB, _merge(shift + _BITS, h1, k1, v1, h2, k2, v2)))
+    if i1 < i2:
+        return _Node((1 << i1) | (1 << i2), (k1, v1, k2, v2))
+    return _Node((1 << i1) | (1 << i2), (k2, v2, k1, v1))
+
+def _set(node, shift, h, key, value):
+    """Returns (new node, whether the key was added); copies only the path"""
+    if isinstance(node, _Collision):
+        array = node.array
+        for i in range(0, len(array), 2):
+            if array[i] == key:
+                if array[i + 1] is value:
+                    return node, False
+                return _Collision(array[:i + 1] + (value,) + array[i + 2:]), False
+        return _Collision(array + (key, value)), True
+
+    bit = 1 << ((h >> shift) & _MASK)
+    i = 2 * _popcount(node.bitmap & (bit - 1))
+    array = node.array
+    if not node.bitmap & bit:
+        return _Node(node.bitmap | bit, array[:i] + (key, value) + array[i:]), True
+
+    k, v = array[i], array[i + 1]
+    if k is _SUB:
+        child, added = _set(v, shift + _BITS, h, key, value)
+        if child is v:
+            return node, False
+        return _Node(node.bitmap, array[:i + 1] + (child,) + array[i + 2:]), added
+    if k == key:
+        if v is value:
+            return node, False
+        return _Node(node.bitmap, array[:i + 1] + (value,) + array[i + 2:]), False
+    child = _merge(shift + _BITS, _hash(k), k, v, h, key, value)
+    return _Node(node.bitmap, array[:i] + (_SUB, child) + array[i + 2:]), True
+
+def _delete(node, shift, h, key):
+    """
+    Returns (new node or None when it became empty, whether the key was
+    removed). Children left with a single key are folded into their parent.
+    """
+    if isinstance(node, _Collision):
+        array = node.array
+        for i in range(0, len(array), 2):
+            if array[i] == key:
+                array = array[:i] + array[i + 2:]
+                return (_Collision(array) if array else None), True
+        return node, False
+
+    bit = 1 << ((h >> shift) & _MASK)
+    if not node.bitmap & bit:
+        return node, False
+    i = 2 * _popcount(node.bitmap & (bit - 1))
+    array = node.array
+    k, v = array[i], array[i + 1]
+    if k is _SUB:
+        child, removed = _delete(v, shift + _BITS, h, key)
+        if not removed:
+            return node, False
+        if child is not None:
+            single = (len(child.array) == 2 and (isinstance(child, _Collision) or child.array[0] is not _SUB))
+            replacement = child.array if single else (_SUB, child)
+            return _Node(node.bitmap, array[:i] + replacement + array[i + 2:]), True
+    elif k != key:
+        return node, False
+    bitmap = node.bitmap & ~bit
+    if not bitmap:
+        return None, True
+    return _Node(bitmap, array[:i] + array[i + 2:]), True
+
+def _build(entries, shift):
+    """Trie of (hash, key, value) entries with distinct keys, in one pass"""
+    if shift >= 64:
+        return _Collision(tuple(x for _, key, value in entries for x in (key, value)))
+    buckets = {}
+    for entry in entries:
+        buckets.setdefault((entry[0] >> shift) & _MASK, []).append(entry)
+    bitmap = 0
+    array = []
+    for index in sorted(buckets):
+        bitmap |= 1 << index
+        bucket = buckets[index]
+        if len(bucket) == 1:
+            array.extend(bucket[0][1:])
+        else:
+            array.extend((_SUB, _build(bucket, shift + _BITS)))
+    return _Node(bitmap, tuple(array))
+
+class PersistentMap:
+    """
+    Immutable hash map (hash array mapped trie). set() and delete() return a
+    new map that shares every trie node off the changed path with this one.
+    """
+    __slots__ = ("_root", "_len")
+
+    def __init__(self, root=_EMPTY_NODE, length=0):
+        self._root = root
+        self._len = length
+
+    @classmethod
+    def from_items(cls, items):
+        entries = {}
+        for key, value in items:
+            entries[key] = value
+        if not entries:
+            return EMPTY_MAP
+        root = _build([(_hash(key), key, value) for key, value in entries.items()], 0)
+        return cls(root, len(entries))
+
+    def get(self, key, default=None):
+        return _get(self._root, _hash(key), key, default)
+
+    def set(self, key, value):
+        root, added = _set(self._root, 0, _hash(key), key, value)
+        if root is self._root:
+            return self
+        return PersistentMap(root, self._len + added)
+
+    def delete(self, key):
+        root, removed = _delete(self._root, 0, _hash(key), key)
+        if not removed:
+            return self
+        return PersistentMap(root if root is not None else _EMPTY_NODE, self._len - 1)
+
+    def items(self):
+        stack = [self._root]
+        while stack:
+            array = stack.pop().array
+            for i in range(0, len(array), 2):
+                if array[i] is _SUB:
+                    stack.append(array[i + 1])
+                else:
+                    yield array[i], array[i + 1]
+
+    def __iter__(self):
+        return (key for key, _ in self.items())
+
+    def __contains__(self, key):
+        return _get(self._root, _hash(key), key, _SUB) is not _SUB
+
+    def __len__(self):
+        return self._len
+
+EMPTY_MAP = PersistentMap()
+
+class PersistentGraph:
+    """
+    Immutable undirected graph. Node -> (neighbour -> edge) adjacency maps
+    are persistent maps, so add_edge and remove_edge return a new graph in
+    O(log n) that shares all unchanged adjacency with this one. Each edge is
+    kept in the direction in which it was added.
+    """
+    __slots__ = ("adj", "edge_count")
+
+    def __init__(self, adj=EMPTY_MAP, edge_count=0):
+        self.adj = adj
+        self.edge_count = edge_count
+
+    @classmethod
+    def from_edges(cls, edges, nodes=()):
+        """Builds a graph from oriented edges (and extra isolated nodes)"""
+        adjacency = {node: {} for node in nodes}
+        count = 0
+        for u, v in edges:
+            nbrs = adjacency.setdefault(u, {})
+            if v in nbrs:
+                continue
+            nbrs[v] = (u, v)
+            adjacency.setdefault(v, {})[u] = (u, v)
+            count += 1
+        adj = PersistentMap.from_items(
+            (node, PersistentMap.from_items(nbrs.items())) for node, nbrs in adjacency.items())
+        return cls(adj, count)
+
+    def has_edge(self, u, v):
+        nbrs = self.adj.get(u)
+        return nbrs is not None and v in nbrs
+
+    def add_edge(self, u, v):
+        if self.has_edge(u, v):
+            return self
+        edge = (u, v)
+        adj = self.adj.set(u, self.adj.get(u, EMPTY_MAP).set(v, edge))
+        if u != v:
+            adj = adj.set(v, adj.get(v, EMPTY_MAP).set(u, edge))
+        return PersistentGraph(adj, self.edge_count + 1)
+
+    def remove_edge(self, u, v):
+        """Removes an edge, keeping its endpoints like nx.Graph does"""
+        if not self.has_edge(u, v):
+            return self
+        adj = self.adj.set(u, self.adj.get(u).delete(v))
+        if u != v:
+            adj = adj.set(v, adj.get(v).delete(u))
+        return PersistentGraph(adj, self.edge_count - 1)
+
+    def nodes(self):
+        return iter(self.adj)
+
+    def edges(self):
+        """Every edge once, in the direction in which it was added"""
+        seen = set()
+        for node, nbrs in self.adj.items():
+            for nbr, edge in nbrs.items():
+                if nbr not in seen:
+                    yield edge
+            seen.add(node)
+
+    def number_of_nodes(self):
+        return len(self.adj)
+
+    def number_of_edges(self):
+        return self.edge_count
+
+EMPTY_GRAPH = PersistentGraph()
@@ -0,0 +1,130 @@
+import asyncio
+import hashlib
+import os
+import secrets
+import time
+from collections import OrderedDict
+from timeline import TimeLine
+from timeline_log import TimelineLog
+
+# Limits for the session store; sessions beyond any of them are evicted,
+# least recently used first
+SESSION_MAX = int(os.environ.get("SESSION_MAX", "500"))
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", "3600"))  # seconds
+SESSION_MEMORY_BUDGET = int(os.environ.get("SESSION_MEMORY_BUDGET", str(2 * 1024 ** 3)))  # bytes
+# Directory of the per-session timeline logs; unset keeps timelines in memory only
+SESSION_LOG_DIR = os.environ.get("SESSION_LOG_DIR") or None
+
+# Rough per-item costs used to estimate the memory held by a session
+NODE_BYTES = 400  # Graph node with its adjacency dict and core bookkeeping
+EDGE_BYTES = 650  # Adjacency entries, direction and level set entries, persistent state
+CHANGE_BYTES = 2000  # Timeline node columns and its share of the persistent states
+
+# Cookie holding the session ID issued to clients that send none
+SESSION_COOKIE = "session_id"
+
+def new_session_id():
+    return secrets.token_urlsafe(16)
+
+class Session:
+    """
+    Visualisation state of one client: its timeline, the core data last sent
+    to it and a lock serializing its requests.
+    """
+
+    def __init__(self, session_id, log_path=None):
+        self.id = session_id
+        self.log_path = log_path
+        self.timeline = None
+        if log_path is not None and os.path.exists(log_path):
+            try:
+                self.timeline = TimeLine.from_log(log_path)
+            except (ValueError, KeyError):
+                self.timeline = None  # Unreadable log; start over
+        if self.timeline is None:
+            self.reset_timeline()
+        self.core_data = {}
+        self.lock = asyncio.Lock()
+        self.last_access = time.monotonic()
+
+    def reset_timeline(self):
+        """Replaces the timeline by an empty one, starting a new log"""
+        self.close()
+        log = TimelineLog(self.log_path, truncate=True) if self.log_path is not None else None
+        self.timeline = TimeLine(log=log)
+        return self.timeline
+
+    def close(self):
+        if self.timeline is not None and self.timeline.log is not None:
+            self.timeline.log.close()
+
+    def estimated_size(self):
+        graph = self.timeline.graph
+        return (graph.number_of_nodes() * NODE_BYTES
+                + graph.number_of_edges() * EDGE_BYTES
+                + len(self.timeline.store) * CHANGE_BYTES
+                + self.timeline.results.weight)
+
+class SessionManager:
+    """
+    Holds the sessions of this process with LRU and idle-TTL eviction and an
+    estimated memory budget.
+    """
+
+    def __init__(self, max_sessions=SESSION_MAX, idle_ttl=SESSION_IDLE_TTL,
+                 memory_budget=SESSION_MEMORY_BUDGET, log_dir=SESSION_LOG_DIR):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.memory_budget = memory_budget
+        self.log_dir = log_dir
+        if log_dir is not None:
+            os.makedirs(log_dir, exist_ok=True)
+        self.sessions = OrderedDict()
+
+    def log_path(self, session_id):
+        """Log file of a session; evicted sessions are reloaded from it"""
+        if self.log_dir is None:
+            return None
+        # Session IDs come from clients, so they are never used as file names
+        digest = hashlib.sha256(session_id.encode()).hexdigest()
+        return os.path.join(self.log_dir, digest + ".tlog")
+
+    def get(self, session_id):
+        """Returns the session, creating it if needed, and marks it as used."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = Session(session_id, self.log_path(session_id))
+            self.sessions[session_id] = session
+        self.sessions.move_to_end(session_id)
+        session.last_access = time.monotonic()
+        self.evict()
+        return session
+
+    def evict(self):
+        """
+        Drops idle sessions, then least recently used ones until the store is
+        within its count and memory limits. The most recent session and
+        sessions with a request in progress are kept.
+        """
+        now = time.monotonic()
+        for session_id, session in list(self.sessions.items()):
+            if now - session.last_access > self.idle_ttl and not session.lock.locked():
+                del self.sessions[session_id]
+                session.close()
+
+        total = sum(session.estimated_size() for session in self.sessions.values())
+        for session_id, session in list(self.sessions.items())[:-1]:
+            if len(self.sessions) <= self.max_sessions and total <= self.memory_budget:
+                break
+            if session.lock.locked():
+                continue
+            del self.sessions[session_id]
+            total -= session.estimated_size()
+            session.close()
+
+    def close(self):
+        for session in self.sessions.values():
+            session.close()
+
+    def __len__(self):
+        return len(self.sessions)
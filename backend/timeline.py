@@ -1,101 +1,814 @@
+import itertools
+import json
+import os
 import networkx as nx
+from array import array
 from typing import Optional
+from core_maintenance import CoreMaintainer, _edge_hash
+from lru_cache import LRUCache
+from persistent_graph import EMPTY_GRAPH, PersistentGraph
+import timeline_log
+
+# Process-wide timeline identities, so a client can tell that its copy of a
+# timeline belongs to a timeline that has since been replaced
+_timeline_ids = itertools.count(1)
+
+# Restoring the graph from a node's persistent state costs about as much as
+# replaying one change of the net diff per this many edges of the current
+# graph, when the replay skips core maintenance
+RESTORE_EDGES_PER_CHANGE = 2
+# Navigations whose net diff has more changes than this skip core
+# maintenance, which can walk a whole k-shell per change, and recompute the
+# decomposition once on the next read, unless the target's is cached
+MAINTAIN_STEPS = 4
+
+# Nodes at depths that are a multiple of STATE_INTERVAL keep a persistent
+# graph state, derived when they are appended, so that reading any state
+# applies fewer than STATE_INTERVAL changes to a kept one
+STATE_INTERVAL = 16
+
+# Results (core data, polygon data) computed at timeline nodes are kept for
+# revisits, up to RESULT_CACHE_BUDGET estimated bytes per timeline
+RESULT_CACHE_ENTRIES = int(os.environ.get("TIMELINE_RESULT_CACHE_ENTRIES", "256"))
+RESULT_CACHE_BUDGET = int(os.environ.get("TIMELINE_RESULT_CACHE_BUDGET", str(256 * 1024 ** 2)))
+RESULT_ITEM_BYTES = 40  # Node ID or edge endpoint in a cached result
+
+# Timelines are compacted once they hold more than TIMELINE_COMPACT_NODES
+# nodes (0 disables it): side branches of the current node's path that were
+# not visited during the last TIMELINE_BRANCH_MAX_AGE changes, or beyond the
+# TIMELINE_MAX_BRANCHES most recently visited ones, are dropped, and linear
+# runs of nodes not visited during the last TIMELINE_COMPACT_KEEP_RECENT
+# changes are collapsed into segment nodes
+COMPACT_NODES = int(os.environ.get("TIMELINE_COMPACT_NODES", "100000"))
+BRANCH_MAX_AGE = int(os.environ.get("TIMELINE_BRANCH_MAX_AGE", "10000"))
+MAX_BRANCHES = int(os.environ.get("TIMELINE_MAX_BRANCHES", "64"))
+COMPACT_KEEP_RECENT = int(os.environ.get("TIMELINE_COMPACT_KEEP_RECENT", "1000"))
+
+NO_NODE = 0  # Node ID used for "no parent", "no child" and "no sibling"
+SEGMENT = 2  # Action of a node holding the net diff of collapsed changes
+REMOVED = -2  # Action left at the ID of a node dropped by compaction
+
+class TimeLineStore:
+    """
+    Column storage of a timeline tree. Node IDs index parallel typed arrays
+    holding each node's change, tree links and skip pointer, so a recorded
+    change costs about 60 bytes, plus its share of the persistent states
+    kept at STATE_INTERVAL depths (about 2 KB when edits touch different
+    nodes). Edge endpoints must be integers. ID 1 is
+    the root, which records no change. IDs of nodes dropped by compaction
+    are never reused, so the IDs of the remaining nodes stay stable.
+    """
+
+    def __init__(self):
+        # Index 0 is a placeholder so that IDs index the arrays directly
+        self.action = array('b', [-1, -1])  # 1 for add_edge, 0 for remove_edge
+        self.source = array('q', [0, 0])
+        self.target = array('q', [0, 0])
+        self.parent = array('i', [NO_NODE, NO_NODE])
+        self.first_child = array('i', [NO_NODE, NO_NODE])
+        self.last_child = array('i', [NO_NODE, NO_NODE])
+        self.next_sibling = array('i', [NO_NODE, NO_NODE])
+        self.depth = array('i', [0, 0])
+        # Skip pointer to an ancestor whose distance follows the skew-binary
+        # decomposition of the depth (Myers), so that any ancestor is reached
+        # in O(log depth) jumps with O(1) setup per node
+        self.jump = array('i', [NO_NODE, 1])
+        self.fingerprint = array('q', [0, 0])  # Edge set fingerprint of the graph in the node's state
+        self.visited = array('q', [0, 0])  # Timeline revision at which the node was last current
+        self.segments = {}  # Node ID -> (action, source, target) steps of a SEGMENT node
+        # Node ID -> PersistentGraph of the root, of loads and of nodes at
+        # STATE_INTERVAL depths, see TimeLine.graph_at
+        self.states = {1: EMPTY_GRAPH}
+        self.removed = 0
+
+    def __len__(self):
+        return len(self.action) - 1 - self.removed
+
+    def __contains__(self, node_id):
+        return 1 <= node_id < len(self.action) and self.action[node_id] != REMOVED
+
+    def append(self, parent_id, action, source_node, target_node, node_id=None):
+        """
+        Adds a child node recording a change and returns its ID, the next
+        free one unless node_id (of a node read back from a log) is given
+        """
+        if node_id is not None:
+            while len(self.action) < node_id:
+                self._append_columns(NO_NODE, REMOVED, 0, 0)
+                self.removed += 1
+        node_id = self._append_columns(parent_id, action, source_node, target_node)
+        self._link(node_id, parent_id)
+        return node_id
+
+    def append_segment(self, parent_id, steps, node_id=None):
+        """Adds a child node recording several changes and returns its ID"""
+        node_id = self.append(parent_id, SEGMENT, 0, 0, node_id)
+        self.segments[node_id] = tuple(steps)
+        return node_id
+
+    def _append_columns(self, parent_id, action, source_node, target_node):
+        self.action.append(action)
+        self.source.append(source_node)
+        self.target.append(target_node)
+        self.parent.append(parent_id)
+        self.first_child.append(NO_NODE)
+        self.last_child.append(NO_NODE)
+        self.next_sibling.append(NO_NODE)
+        self.depth.append(0)
+        self.jump.append(NO_NODE)
+        self.fingerprint.append(0)
+        self.visited.append(0)
+        return len(self.action) - 1
+
+    def _link(self, node_id, parent_id):
+        """Sets the depth and skip pointer of a node and adds it as its parent's last child"""
+        jump = self.jump[parent_id]
+        if self.depth[parent_id] - self.depth[jump] == self.depth[jump] - self.depth[self.jump[jump]]:
+            jump = self.jump[jump]
+        else:
+            jump = parent_id
+        self.depth[node_id] = self.depth[parent_id] + 1
+        self.jump[node_id] = jump
+
+        if self.last_child[parent_id] == NO_NODE:
+            self.first_child[parent_id] = node_id
+        else:
+            self.next_sibling[self.last_child[parent_id]] = node_id
+        self.last_child[parent_id] = node_id
+
+    def remove(self, node_id):
+        """Drops a node; its children must be removed or given another parent"""
+        self.action[node_id] = REMOVED
+        self.parent[node_id] = NO_NODE
+        self.segments.pop(node_id, None)
+        self.states.pop(node_id, None)
+        self.removed += 1
+
+    def set_segment(self, node_id, steps):
+        """Makes a node record several changes instead of its own"""
+        self.action[node_id] = SEGMENT
+        self.source[node_id] = self.target[node_id] = 0
+        self.segments[node_id] = tuple(steps)
+
+    def relink(self):
+        """
+        Rebuilds the child lists, depths and skip pointers from the parent
+        links after nodes were removed or moved. A parent always has a
+        smaller ID than its children, so one pass in ID order suffices.
+        """
+        for node_id in range(1, len(self.action)):
+            self.first_child[node_id] = self.last_child[node_id] = self.next_sibling[node_id] = NO_NODE
+        for node_id in range(2, len(self.action)):
+            if self.action[node_id] != REMOVED:
+                self._link(node_id, self.parent[node_id])
+
+    def children(self, node_id):
+        child = self.first_child[node_id]
+        while child != NO_NODE:
+            yield child
+            child = self.next_sibling[child]
+
+    def change(self, node_id):
+        """
+        (action, source, target) of a node, Nones for the root and SEGMENT
+        with Nones for segments
+        """
+        if node_id == 1:
+            return None, None, None
+        if self.action[node_id] == SEGMENT:
+            return SEGMENT, None, None
+        return self.action[node_id], self.source[node_id], self.target[node_id]
+
+    def changes(self, node_id):
+        """The (action, source, target) steps recorded by a node, in order"""
+        if node_id == 1:
+            return ()
+        if self.action[node_id] == SEGMENT:
+            return self.segments[node_id]
+        return ((self.action[node_id], self.source[node_id], self.target[node_id]),)
+
+    def ancestor_at_depth(self, node_id, depth):
+        node_depth, jump, parent = self.depth, self.jump, self.parent
+        while node_depth[node_id] > depth:
+            node_id = jump[node_id] if node_depth[jump[node_id]] >= depth else parent[node_id]
+        return node_id
+
+    def lowest_common_ancestor(self, a, b):
+        depth, jump, parent = self.depth, self.jump, self.parent
+        if depth[a] > depth[b]:
+            a = self.ancestor_at_depth(a, depth[b])
+        elif depth[b] > depth[a]:
+            b = self.ancestor_at_depth(b, depth[a])
+        # Skip targets only depend on the depth, so both sides move in lockstep
+        while a != b:
+            if a == 1 or a == NO_NODE or b == NO_NODE:
+                raise ValueError("No common ancestor found, which should not happen")
+            if jump[a] != jump[b]:
+                a, b = jump[a], jump[b]
+            else:
+                a, b = parent[a], parent[b]
+        return a
 
 class TimeLineNode:
-    _next_id = 1  # Class variable to track IDs
-    
-    def __init__(self, action, source_node, target_node, parent=None):
-        self.action = action  # 1 for add_edge, 0 for remove_edge
-        self.source_node = source_node
-        self.target_node = target_node
-        self.parent = parent
-        self.children = []
-        self.id = TimeLineNode._next_id
-        TimeLineNode._next_id += 1
+    """
+    View of one node of a timeline. Views are created on demand and compare
+    equal when they refer to the same node.
+    """
+    __slots__ = ("store", "id")
+
+    def __init__(self, store, node_id):
+        self.store = store
+        self.id = node_id
+
+    def __eq__(self, other):
+        return isinstance(other, TimeLineNode) and self.id == other.id and self.store is other.store
+
+    def __hash__(self):
+        return hash(self.id)
+
+    @property
+    def action(self):
+        return self.store.change(self.id)[0]
+
+    @property
+    def source_node(self):
+        return self.store.change(self.id)[1]
+
+    @property
+    def target_node(self):
+        return self.store.change(self.id)[2]
+
+    @property
+    def parent(self) -> Optional["TimeLineNode"]:
+        parent_id = self.store.parent[self.id]
+        return TimeLineNode(self.store, parent_id) if parent_id != NO_NODE else None
+
+    @property
+    def children(self):
+        return [TimeLineNode(self.store, child) for child in self.store.children(self.id)]
+
+    @property
+    def depth(self):
+        return self.store.depth[self.id]
+
+    @property
+    def fingerprint(self):
+        return self.store.fingerprint[self.id]
+
+    @fingerprint.setter
+    def fingerprint(self, value):
+        self.store.fingerprint[self.id] = value
     
     def __repr__(self):
         action_str = "Add" if self.action == 1 else "Remove"
         return f"TimeLineNode({action_str} edge ({self.source_node}, {self.target_node}), ID: {self.id}"
     
+    def ancestor_at_depth(self, depth):
+        """The ancestor of this node (or the node itself) at the given depth"""
+        return TimeLineNode(self.store, self.store.ancestor_at_depth(self.id, depth))
+
+    def is_ancestor_of(self, node):
+        """Whether this node is a proper ancestor of node"""
+        store = self.store
+        return (store.depth[self.id] < store.depth[node.id]
+                and store.ancestor_at_depth(node.id, store.depth[self.id]) == self.id)
+
     def to_dict(self):
         """
         Converts the node and its children into a dictionary format.
         """
+        store = self.store
+        result = _shallow_dict(store, self.id)
+        stack = [(self.id, result)]
+        while stack:
+            node_id, node_dict = stack.pop()
+            for child in store.children(node_id):
+                child_dict = _shallow_dict(store, child)
+                node_dict["children"].append(child_dict)
+                stack.append((child, child_dict))
+        return result
+
+    def to_json(self):
+        """
+        Serializes the node and its children like to_dict, straight to JSON
+        text. Unlike JSON encoders, this does not recurse, so it works for
+        histories of any depth.
+        """
+        store = self.store
+        first_child, next_sibling = store.first_child, store.next_sibling
+        parts = []
+        # (node, next child to write, NO_NODE when done, or None before the node is opened)
+        stack = [(self.id, None)]
+        while stack:
+            node_id, child = stack.pop()
+            if child is None:
+                parts.append('{"id":%s,"action":%s,"source_node":%s,"target_node":%s,"children":[' % tuple(
+                    json.dumps(value) for value in (node_id, *store.change(node_id))))
+                child = first_child[node_id]
+            elif child != NO_NODE:
+                parts.append(',')
+            if child != NO_NODE:
+                stack.append((node_id, next_sibling[child]))
+                stack.append((child, None))
+            else:
+                parts.append(']}')
+        return ''.join(parts)
+
+    def to_flat_dict(self):
+        """The node without its children, pointing to its parent by ID"""
+        action, source_node, target_node = self.store.change(self.id)
+        parent_id = self.store.parent[self.id]
         return {
             "id": self.id,
-            "action": self.action,
-            "source_node": self.source_node,
-            "target_node": self.target_node,
-            "children": [child.to_dict() for child in self.children]
+            "parent_id": parent_id if parent_id != NO_NODE else None,
+            "action": action,
+            "source_node": source_node,
+            "target_node": target_node
         }
 
-    @classmethod
-    def reset_ids(cls):
-        """Reset ID counter (useful for testing)"""
-        cls._next_id = 1
+def _shallow_dict(store, node_id):
+    action, source_node, target_node = store.change(node_id)
+    return {
+        "id": node_id,
+        "action": action,
+        "source_node": source_node,
+        "target_node": target_node,
+        "children": []
+    }
 
 class TimeLine:
-    def __init__(self):
-        TimeLineNode.reset_ids()
-        self.root = TimeLineNode(None, None, None)
+    def __init__(self, log=None):
+        # IDs are per timeline so that concurrent sessions do not share them
+        self.store = TimeLineStore()
+        self.root = TimeLineNode(self.store, 1)
+        self.uid = next(_timeline_ids)
+        self.loaded_state = None  # (node ID, nodes, oriented edges) of a load without its state yet
+        self.load_nodes = set()  # IDs of the nodes whose state includes edges loaded there
         self.current_node = self.root
         self.graph = nx.Graph()
+        self.cores = CoreMaintainer(self.graph)  # Live core numbers of self.graph
+        self.revision = 0  # Number of nodes appended to the timeline tree
         self.is_navigating = False
+        # Whether every node at a STATE_INTERVAL depth has its state; after
+        # loads, reloads and compaction they are derived on the next read
+        self.states_complete = True
+        self.log = log  # Optional TimelineLog receiving every recorded change
+        self._batching = False
+        self._compact_at = COMPACT_NODES  # Node count that triggers the next compaction
+        # (node ID, kind) -> result for the graph in that node's state
+        self.results = LRUCache(maxsize=RESULT_CACHE_ENTRIES, maxweight=RESULT_CACHE_BUDGET,
+                                weigh=_result_size)
+
+    @property
+    def version(self):
+        """Graph version, changed by every mutation of self.graph"""
+        return self.cores.version
+
+    def etag(self):
+        """Entity tag covering both the graph version and the timeline tree"""
+        return f'"{self.uid}-{self.version}-{self.revision}"'
+
+    def core_data(self):
+        """
+        Core data of the current graph. A decomposition computed earlier for
+        the same graph at the current node is reused instead of recomputed.
+        """
+        cores = self.cores
+        if cores.cached_version != cores.version:
+            core_data = self.cached_result("core_data")
+            if core_data is not None:
+                cores.remember(core_data)
+                return core_data
+        core_data = cores.core_data()
+        self.store_result("core_data", core_data)
+        return core_data
+
+    def cached_result(self, kind):
+        """A result stored for the current node, if the graph is in its state"""
+        if self.cores.fingerprint != self.current_node.fingerprint:
+            return None
+        return self.results.get((self.current_node.id, kind))
+
+    def result_at(self, node, kind):
+        """
+        A result stored for any node. Only results of graphs in the node's
+        state are ever stored, so no fingerprint check is needed.
+        """
+        return self.results.get((node.id, kind))
+
+    def store_result(self, kind, result, node_id=None, fingerprint=None):
+        """
+        Stores a result for the current node and graph, or for the node and
+        graph fingerprint it was computed from when that may have changed
+        since. Results of graphs that are not in the node's state (say, while
+        a client replays a navigation) are not stored.
+        """
+        if node_id is None:
+            node_id, fingerprint = self.current_node.id, self.cores.fingerprint
+        if node_id not in self.store or self.store.fingerprint[node_id] != fingerprint:
+            return
+        key = (node_id, kind)
+        if self.results.get(key) is not result:
+            self.results.put(key, result)
+
+    def load_edges(self, edges):
+        """Adds edges directly to the graph without recording them in the timeline"""
+        self.cores.load(edges)
+        # Earlier results lack these edges
+        self.results.clear()
+        self.current_node.fingerprint = self.cores.fingerprint
+        # The persistent state is only built if an old state is ever read;
+        # states below this node lack the loaded edges
+        store = self.store
+        for node_id in list(store.states):
+            if node_id == self.current_node.id or self.current_node.is_ancestor_of(TimeLineNode(store, node_id)):
+                del store.states[node_id]
+        self.states_complete = False
+        self.loaded_state = (self.current_node.id, tuple(self.graph.nodes), tuple(self.cores.directions))
+        self.load_nodes.add(self.current_node.id)
+        if self.log is not None:
+            self.log.append_many((self.current_node.id, -1, timeline_log.LOADED_EDGE, u, v) for u, v in edges)
+            self.log.flush()
+
+    @classmethod
+    def from_log(cls, path):
+        """
+        Rebuilds a timeline from its log in one pass: the tree is recreated
+        from the records and the graph at the logged current node is loaded
+        in bulk. Further changes are appended to the same log.
+        """
+        ids, parent_ids, actions, sources, targets = timeline_log.read_records(path)
+        timeline = cls()
+        store = timeline.store
+        loaded = {}  # Node ID -> edges loaded there
+        current = 1
+        i = 0
+        while i < len(ids):
+            node_id, parent_id, action = ids[i], parent_ids[i], actions[i]
+            if action == timeline_log.LOADED_EDGE:
+                loaded.setdefault(node_id, []).append((sources[i], targets[i]))
+            elif action == timeline_log.MOVE:
+                current = node_id
+                store.visited[current] = len(store.action) - 2
+            else:
+                if parent_id not in store:
+                    raise ValueError(f"{path}: node {node_id} has no parent {parent_id}")
+                if action == timeline_log.SEGMENT:
+                    # The header is followed by the segment's steps
+                    end = i + 1 + sources[i]
+                    steps = zip(actions[i + 1:end], sources[i + 1:end], targets[i + 1:end])
+                    current = store.append_segment(parent_id, steps, node_id)
+                    i = end - 1
+                else:
+                    current = store.append(parent_id, action, sources[i], targets[i], node_id)
+                store.visited[current] = current - 1
+            i += 1
+        # The n-th appended node has ID n + 1, including nodes since dropped
+        timeline.revision = len(store.action) - 2
+        _set_fingerprints(store, loaded)
+
+        # Edges of the graph at the current node, in their original direction
+        edges = {}
+        for node_id in reversed(_path_up(store, current, NO_NODE)):
+            for action, source_node, target_node in store.changes(node_id):
+                edge = frozenset((source_node, target_node))
+                if action == 1:
+                    edges.setdefault(edge, (source_node, target_node))
+                else:
+                    edges.pop(edge, None)
+            for u, v in loaded.get(node_id, ()):
+                edges.setdefault(frozenset((u, v)), (u, v))
+        timeline.current_node = TimeLineNode(store, current)
+        timeline.cores.load(edges.values())
+
+        if loaded:
+            # States are derived from the last load, as after load_edges
+            load_id = list(loaded)[-1]
+            store.states.pop(load_id, None)
+            timeline.loaded_state = (load_id, (), tuple(loaded[load_id]))
+        timeline.load_nodes.update(loaded)
+        timeline.states_complete = False
+        timeline.log = timeline_log.TimelineLog(path)
+        return timeline
+
+    def move_to(self, node):
+        """
+        Makes node the current node without touching the graph, for clients
+        that replay the navigation themselves.
+        """
+        self.current_node = node
+        self._record_move()
+
+    def _record_move(self):
+        self.store.visited[self.current_node.id] = self.revision
+        if self.log is not None:
+            self.log.append(self.current_node.id, -1, timeline_log.MOVE, 0, 0)
+            self.log.flush()
     
     def add_change(self, action, source_node, target_node):
         if self.is_navigating:
             raise RuntimeError("Cannot add changes while navigating the timeline")
         
-        new_node = TimeLineNode(action, source_node, target_node, parent=self.current_node)
-        self.current_node.children.append(new_node)
-        self.current_node = new_node
-        
+        # Nothing is recorded for a change the graph rejects
+        validate_changes(self.graph, [(action, source_node, target_node)])
         if action == 1:
-            self.graph.add_edge(source_node, target_node)
+            self.cores.insert_edge(source_node, target_node)
         else:
-            self.graph.remove_edge(source_node, target_node)
+            self.cores.remove_edge(source_node, target_node)
+
+        store = self.store
+        parent_id = self.current_node.id
+        node_id = store.append(parent_id, action, source_node, target_node)
+        self.current_node = TimeLineNode(store, node_id)
+        self.revision += 1
+        store.visited[node_id] = self.revision
+        store.fingerprint[node_id] = self.cores.fingerprint
+        if self.states_complete and store.depth[node_id] % STATE_INTERVAL == 0:
+            self._derive_state(self._state_base(parent_id), node_id)
+
+        if self.log is not None:
+            self.log.append(node_id, parent_id, action, source_node, target_node)
+            if not self._batching:
+                self.log.flush()
+        if not self._batching:
+            self._maybe_compact()
+
+    def graph_at(self, node):
+        """
+        Read-only graph in the state of a timeline node, derived in O(log n)
+        per change from the nearest ancestor with a kept state, fewer than
+        STATE_INTERVAL changes up. States share all but the changed
+        adjacency with the state they were derived from. The state of loaded
+        graphs is built on first use.
+        """
+        if not self.states_complete:
+            self._complete_states()
+        return self._derive_state(self._state_base(node.id), node.id)
+
+    def _state_base(self, node_id):
+        """The nearest node from node_id up with a kept state"""
+        store = self.store
+        while node_id not in store.states:
+            if self.loaded_state is not None and node_id == self.loaded_state[0]:
+                _, nodes, edges = self.loaded_state
+                store.states[node_id] = PersistentGraph.from_edges(edges, nodes)
+                self.loaded_state = None
+                break
+            node_id = store.parent[node_id]
+        return node_id
+
+    def _complete_states(self):
+        """
+        Derives the missing states at STATE_INTERVAL depths in one pass; a
+        parent always has a smaller ID than its children, so each one starts
+        from a kept state nearby.
+        """
+        store = self.store
+        depth, states = store.depth, store.states
+        for node_id in range(2, len(store.action)):
+            if node_id in store and depth[node_id] % STATE_INTERVAL == 0 and node_id not in states:
+                self._derive_state(self._state_base(node_id), node_id)
+        self.states_complete = True
+
+    def _derive_state(self, base, node_id):
+        """
+        Applies the changes from a node with a kept state down to one of its
+        descendants, keeping the states at interval depths on the way.
+        """
+        store = self.store
+        state = store.states[base]
+        for step in reversed(_path_up(store, node_id, base)):
+            for action, source_node, target_node in store.changes(step):
+                if action == 1:
+                    state = state.add_edge(source_node, target_node)
+                else:
+                    state = state.remove_edge(source_node, target_node)
+            if store.depth[step] % STATE_INTERVAL == 0:
+                store.states[step] = state
+        return state
     
+    def delta_since(self, timeline_id, revision):
+        """
+        Nodes appended after the given revision of this timeline, in append
+        order, or None when the client needs the full tree instead.
+        """
+        if timeline_id != self.uid or not 0 <= revision <= self.revision:
+            return None
+        # The n-th appended node has ID n + 1
+        return [TimeLineNode(self.store, node_id).to_flat_dict()
+                for node_id in range(revision + 2, self.revision + 2) if node_id in self.store]
+
+    def subtree(self, node, max_depth, max_children, offset=0):
+        """
+        The tree below node, max_depth levels deep, as nested dicts like
+        to_dict() with the number of children of every node in child_count.
+        Each node lists at most max_children children, starting at offset
+        for node itself, plus the child leading to the current node. Nodes
+        listing fewer children than child_count are collapsed; clients expand
+        them with another call rooted there.
+
+        When the current node lies deeper, the way to it continues with a
+        window of the tree around it, whose top carries the number of levels
+        left out above it in hidden_levels and the first of them in
+        hidden_top, from where clients expand the gap.
+        """
+        store = self.store
+        depth = store.depth
+        current_id = self.current_node.id
+        if store.ancestor_at_depth(current_id, depth[node.id]) != node.id:
+            return self._subtree_dict(node.id, max_depth, max_children, offset, NO_NODE)
+        bottom = store.ancestor_at_depth(current_id, min(depth[current_id], depth[node.id] + max_depth))
+        result = self._subtree_dict(node.id, max_depth, max_children, offset, bottom)
+        if bottom == current_id:
+            return result
+
+        window_id = store.ancestor_at_depth(current_id, max(depth[bottom] + 1, depth[current_id] - max_depth // 2))
+        window = self._subtree_dict(window_id, max_depth, max_children, 0, current_id)
+        window["hidden_levels"] = depth[window_id] - depth[bottom] - 1
+        if window["hidden_levels"]:
+            window["hidden_top"] = store.ancestor_at_depth(current_id, depth[bottom] + 1)
+        bottom_dict = result
+        for node_id in reversed(_path_up(store, bottom, node.id)):
+            bottom_dict = next(child for child in bottom_dict["children"] if child["id"] == node_id)
+        bottom_dict["children"].append(window)
+        return result
+
+    def _subtree_dict(self, top_id, max_depth, max_children, offset, bottom_id):
+        """Nested dicts of subtree(), always listing the way from top_id to bottom_id"""
+        store = self.store
+        towards = set(_path_up(store, bottom_id, top_id)) if bottom_id != NO_NODE else set()
+        result = _shallow_dict(store, top_id)
+        stack = [(top_id, result, 0)]
+        while stack:
+            node_id, node_dict, depth = stack.pop()
+            children = list(store.children(node_id))
+            node_dict["child_count"] = len(children)
+            if depth >= max_depth:
+                continue
+            start = offset if node_id == top_id else 0
+            listed = children[start:start + max_children]
+            for child in children:
+                if child in towards and child not in listed:
+                    listed.append(child)
+            for child in listed:
+                child_dict = _shallow_dict(store, child)
+                node_dict["children"].append(child_dict)
+                stack.append((child, child_dict, depth + 1))
+        return result
+
+    def find_node(self, node_id) -> Optional[TimeLineNode]:
+        """Constant-time lookup of a node of this timeline by its ID"""
+        if node_id not in self.store:
+            return None
+        return TimeLineNode(self.store, node_id)
+
+    def apply_changes(self, changes):
+        """
+        Records a batch of (action, source, target) changes as consecutive
+        timeline nodes. The batch is validated first so that an invalid
+        removal leaves the timeline untouched.
+        """
+        validate_changes(self.graph, changes)
+        self.cores.prepare_batch(len(changes))
+        self._batching = True
+        try:
+            for action, source_node, target_node in changes:
+                self.add_change(action, source_node, target_node)
+        finally:
+            self._batching = False
+            if self.log is not None:
+                self.log.flush()
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        if COMPACT_NODES and len(self.store) > self._compact_at:
+            self.compact()
+            # Compaction is linear in the tree size, so let the tree double first
+            self._compact_at = max(COMPACT_NODES, 2 * len(self.store))
+
+    def compact(self, max_age=BRANCH_MAX_AGE, max_branches=MAX_BRANCHES, keep_recent=COMPACT_KEEP_RECENT):
+        """
+        Bounds the tree of a long-lived timeline. Side branches off the path
+        from the root to the current node are dropped when they were not
+        visited during the last max_age changes or are not among the
+        max_branches most recently visited ones. Then every run of nodes with
+        a single child that were not visited during the last keep_recent
+        changes is collapsed into its last node, which becomes a SEGMENT
+        node holding the run's net diff. Remaining nodes keep their IDs and
+        states; the timeline gets a new uid so that clients refetch it.
+        """
+        store = self.store
+        action, parent, visited = store.action, store.parent, store.visited
+        size = len(action)
+        current_id = self.current_node.id
+
+        # Latest visit in every subtree; children have larger IDs than their parents
+        latest = array('q', visited)
+        for node_id in range(size - 1, 1, -1):
+            if action[node_id] != REMOVED and latest[node_id] > latest[parent[node_id]]:
+                latest[parent[node_id]] = latest[node_id]
+        path = set(_path_up(store, current_id, NO_NODE))
+        branches = [child for node_id in path for child in store.children(node_id) if child not in path]
+        branches.sort(key=lambda node_id: latest[node_id], reverse=True)
+        evicted = {node_id for rank, node_id in enumerate(branches)
+                   if rank >= max_branches or self.revision - latest[node_id] > max_age}
+
+        first_child, last_child = store.first_child, store.last_child
+        merged = {}  # Node ID -> steps of the collapsed nodes above it
+        for node_id in range(2, size):
+            if action[node_id] == REMOVED:
+                continue
+            if node_id in evicted or action[parent[node_id]] == REMOVED:
+                store.remove(node_id)
+                continue
+            steps = merged.pop(node_id, None)
+            child = first_child[node_id]
+            if (child != NO_NODE and child == last_child[node_id] and node_id != current_id
+                    and node_id not in self.load_nodes
+                    and self.revision - visited[node_id] > keep_recent):
+                # Fold this node into its only child; the run shares one list
+                steps = steps if steps is not None else []
+                steps.extend(store.changes(node_id))
+                merged[child] = steps
+                parent[child] = parent[node_id]
+                store.remove(node_id)
+            elif steps is not None:
+                steps.extend(store.changes(node_id))
+                store.set_segment(node_id, (tuple(step) for step in compress_actions(steps)))
+        store.relink()
+
+        self.load_nodes = {node_id for node_id in self.load_nodes if node_id in store}
+        # Depths changed, so the kept states move to the new interval depths
+        store.states = {node_id: state for node_id, state in store.states.items()
+                        if node_id == 1 or node_id in self.load_nodes or store.depth[node_id] % STATE_INTERVAL == 0}
+        self.states_complete = False
+        if self.loaded_state is not None and self.loaded_state[0] not in store:
+            self.loaded_state = None
+        for key in list(self.results.entries):
+            if key[0] not in store:
+                self.results.pop(key)
+        self.uid = next(_timeline_ids)
+        self._rewrite_log()
+
+    def _rewrite_log(self):
+        """
+        Replaces the log by the records of the remaining nodes, with a move
+        record for every revisited node roughly where the visit happened
+        """
+        if self.log is None:
+            return
+        self.log.flush()
+        store = self.store
+        ids, _, actions, sources, targets = timeline_log.read_records(self.log.path)
+        visits = sorted((store.visited[node_id], node_id) for node_id in range(2, len(store.action))
+                        if node_id in store and store.visited[node_id] > node_id - 1)
+        visits.reverse()
+        records = []
+        for node_id in range(2, len(store.action)):
+            if node_id not in store:
+                continue
+            while visits and visits[-1][0] < node_id - 1:
+                records.append((visits.pop()[1], -1, timeline_log.MOVE, 0, 0))
+            parent_id = store.parent[node_id]
+            steps = store.changes(node_id)
+            if store.action[node_id] == SEGMENT:
+                records.append((node_id, parent_id, timeline_log.SEGMENT, len(steps), 0))
+            records.extend((node_id, parent_id, *step) for step in steps)
+        records.extend((visit[1], -1, timeline_log.MOVE, 0, 0) for visit in reversed(visits))
+        records.extend((node_id, -1, timeline_log.LOADED_EDGE, source_node, target_node)
+                       for node_id, action, source_node, target_node in zip(ids, actions, sources, targets)
+                       if action == timeline_log.LOADED_EDGE and node_id in store)
+        records.append((self.current_node.id, -1, timeline_log.MOVE, 0, 0))
+        self.log.rewrite(records)
+
     def navigate(self, target_node):
-        if target_node == self.current_node:
+        # The graph is not in the current node's state while a client replays
+        # a navigation after move_to, so it is restored instead of replayed
+        in_state = self.cores.fingerprint == self.current_node.fingerprint
+        if target_node == self.current_node and in_state:
             return
         
         self.is_navigating = True
-        
-        # Check if target is in current branch (either ancestor or descendant)
-        if self._is_in_branch(target_node):
-            # Same branch navigation
-            if self._is_ancestor(target_node):
-                # Moving up to ancestor - just reverse changes
-                path = self._get_path_to_node(target_node)
-                for node in path:
-                    self._reverse_change(node)
+        try:
+            steps = self.get_navigation_path(target_node, compress=True) if in_state else None
+            if steps is None or self.graph.number_of_edges() / RESTORE_EDGES_PER_CHANGE < len(steps):
+                # Rebuilding from the target's state is cheaper than the replay
+                state = self.graph_at(target_node)
+                self.cores.restore(state.nodes(), state.edges())
             else:
-                # Moving down to descendant - just apply changes
-                path = self._get_path_from_node(target_node)
-                for node in path:
-                    self._apply_change(node)
-        else:
-            # Original cross-branch navigation
-            path_to_common_ancestor = []
-            node = self.current_node
-            while node != target_node and node.parent is not None:
-                path_to_common_ancestor.append(node)
-                node = node.parent
-            
-            for node in path_to_common_ancestor:
-                self._reverse_change(node)
-            
-            path_to_target = []
-            node = target_node
-            while node != self.current_node and node.parent is not None:
-                path_to_target.append(node)
-                node = node.parent
-            
-            for node in reversed(path_to_target):
-                self._apply_change(node)
+                if len(steps) > MAINTAIN_STEPS:
+                    self.cores.invalidate()
+                # Net diff from the current node to the target
+                for action, source, target in steps:
+                    if action == 1:
+                        self.cores.insert_edge(source, target)
+                    else:
+                        self.cores.remove_edge(source, target)
+        finally:
+            self.is_navigating = False
         
         self.current_node = target_node
-        self.is_navigating = False
+        self._record_move()
 
     def _is_in_branch(self, target_node):
         """Check if target is in current branch (ancestor or descendant)"""
@@ -104,145 +817,175 @@ class TimeLine:
 
     def _is_ancestor(self, node):
         """Check if node is ancestor of current node"""
-        current = self.current_node
-        while current.parent is not None:
-            if current.parent == node:
-                return True
-            current = current.parent
-        return False
+        return node.is_ancestor_of(self.current_node)
 
     def _is_descendant(self, node):
         """Check if node is descendant of current node"""
-        return self._is_ancestor_of(node, self.current_node)
+        return self.current_node.is_ancestor_of(node)
 
     def _is_ancestor_of(self, ancestor, node):
         """Helper to check if ancestor is ancestor of node"""
-        while node.parent is not None:
-            if node.parent == ancestor:
-                return True
-            node = node.parent
-        return False
-
-    def _get_path_to_node(self, target):
-        """Get path from current node to target (ancestor)"""
-        path = []
-        node = self.current_node
-        while node != target and node.parent is not None:
-            path.append(node)
-            node = node.parent
-        return path
-
-    def _get_path_from_node(self, target):
-        """Get path from target to current node (descendant)"""
-        path = []
-        node = target
-        while node != self.current_node and node.parent is not None:
-            path.append(node)
-            node = node.parent
-        return reversed(path)
-    
-    def _reverse_change(self, node):
-        if node.action == 1:
-            self.graph.remove_edge(node.source_node, node.target_node)
-        else:
-            self.graph.add_edge(node.source_node, node.target_node)
-    
-    def _apply_change(self, node):
-        if node.action == 1:
-            self.graph.add_edge(node.source_node, node.target_node)
-        else:
-            self.graph.remove_edge(node.source_node, node.target_node)
+        return ancestor.is_ancestor_of(node)
+
+    def _navigation_nodes(self, target_node, origin=None):
+        """
+        IDs of the nodes whose changes are undone (origin up to, excluding,
+        the lowest common ancestor) and redone (below the ancestor down to the
+        target) to move from origin, by default the current node, to target_node.
+        """
+        store = self.store
+        origin_id = (origin or self.current_node).id
+        lca = store.lowest_common_ancestor(origin_id, target_node.id)
+        return _path_up(store, origin_id, lca), _path_up(store, target_node.id, lca)[::-1]
     
-    def get_navigation_path(self, target_node: TimeLineNode):
+    def get_navigation_path(self, target_node: TimeLineNode, compress=False):
         """
         Returns the sequence of actions needed to navigate to target_node
         Format: [[action, source, target], ...]
+        With compress, only the net edge diff is returned (see compress_actions).
         Does NOT modify any state - purely read-only
         """
         if target_node == self.current_node:
             return []
 
+        upward, downward = self._navigation_nodes(target_node)
+        action_sequence = self._change_sequence(upward, downward)
+        if compress:
+            return compress_actions(action_sequence)
+        return action_sequence
+
+    def _change_sequence(self, upward, downward):
+        """[action, source, target] steps undoing upward, then redoing downward"""
+        changes = self.store.changes
         action_sequence = []
         
-        if self._is_in_branch(target_node):
-            # Same branch navigation
-            if self._is_ancestor(target_node):
-                # Moving up to ancestor
-                path = self._get_path_to_node(target_node)
-                for node in path:
-                    action_sequence.append([
-                        1 if node.action == 0 else 0,  # Inverse action
-                        node.source_node,
-                        node.target_node
-                    ])
-            else:
-                # Moving down to descendant
-                path = self._get_path_from_node(target_node)
-                for node in reversed(path):
-                    action_sequence.append([
-                        node.action,
-                        node.source_node,
-                        node.target_node
-                    ])
-        else:
-            # Find the lowest common ancestor
-            current_ancestors = {}  # Map node to its depth
-            depth = 0
-            node = self.current_node
-            while node is not None:
-                current_ancestors[node] = depth
-                depth += 1
-                node = node.parent
-                
-            # Find the lowest common ancestor by walking up from target_node
-            target_path = []
-            node = target_node
-            lca = None
-            while node is not None:
-                if node in current_ancestors:
-                    lca = node
-                    break
-                target_path.append(node)
-                node = node.parent
-                
-            if lca is None:
-                raise ValueError("No common ancestor found, which should not happen")
-                
-            # Path from current node to LCA
-            current_path = []
-            node = self.current_node
-            while node != lca:
-                current_path.append(node)
-                node = node.parent
-            
-            # Generate actions for upward path (current to LCA)
-            for node in current_path:
-                action_sequence.append([
-                    1 if node.action == 0 else 0,  # Inverse action
-                    node.source_node,
-                    node.target_node
-                ])
-            
-            # Generate actions for downward path (LCA to target)
-            for node in reversed(target_path):
+        # Generate actions for upward path (current to LCA)
+        for node_id in upward:
+            for action, source, target in reversed(changes(node_id)):
                 action_sequence.append([
-                    node.action,
-                    node.source_node,
-                    node.target_node
+                    1 if action == 0 else 0,  # Inverse action
+                    source,
+                    target
                 ])
         
+        # Generate actions for downward path (LCA to target)
+        for node_id in downward:
+            for action, source, target in changes(node_id):
+                action_sequence.append([action, source, target])
         return action_sequence
 
+    def diff(self, from_node: TimeLineNode, to_node: TimeLineNode):
+        """
+        Net edge diff between the graphs at two nodes: (added, removed) lists
+        of [source, target] edges present only at to_node, respectively only
+        at from_node. Does NOT modify any state - purely read-only
+        """
+        added, removed = [], []
+        if from_node == to_node:
+            return added, removed
+        upward, downward = self._navigation_nodes(to_node, origin=from_node)
+        for action, source_node, target_node in compress_actions(self._change_sequence(upward, downward)):
+            (added if action == 1 else removed).append([source_node, target_node])
+        return added, removed
+
+def _result_size(result):
+    """Estimated bytes held by a cached result"""
+    items = 0
+    stack = [result]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple, set)):
+            if value and isinstance(next(iter(value)), (dict, list, tuple, set)):
+                stack.extend(value)
+            else:
+                items += len(value)
+        else:
+            items += 1
+    return items * RESULT_ITEM_BYTES
+
+def compress_actions(action_sequence):
+    """
+    Reduces a sequence of [action, source, target] steps to its net edge
+    diff: every edge appears at most once, with its final action, and edges
+    that end up as they started are dropped. Steps are kept in the order in
+    which their edges first appear.
+    """
+    net = {}  # Undirected edge -> (presence before the sequence, last step)
+    for step in action_sequence:
+        action, source_node, target_node = step
+        edge = frozenset((source_node, target_node))
+        entry = net.get(edge)
+        if entry is None:
+            # Adding an edge implies it was absent before, and vice versa
+            net[edge] = (action == 0, step)
+        else:
+            net[edge] = (entry[0], step)
+    return [list(step) for present, step in net.values() if present != (step[0] == 1)]
+
+def _set_fingerprints(store, loaded):
+    """
+    Sets the graph fingerprint of every node from its parent's, in ID order,
+    which visits parents first. Every recorded change toggles its edge;
+    edges loaded at a node were absent before.
+    """
+    action, source, target = store.action, store.source, store.target
+    fingerprint, parent, segments = store.fingerprint, store.parent, store.segments
+    loaded_hash = {}
+    for node_id, edges in loaded.items():
+        value = 0
+        for edge in {frozenset(edge): edge for edge in edges}.values():
+            value ^= _edge_hash(*edge)
+        loaded_hash[node_id] = value
+    fingerprint[1] = loaded_hash.get(1, 0)
+    for node_id in range(2, len(action)):
+        if action[node_id] == REMOVED:
+            continue
+        value = fingerprint[parent[node_id]] ^ loaded_hash.get(node_id, 0)
+        if action[node_id] == SEGMENT:
+            for _, source_node, target_node in segments[node_id]:
+                value ^= _edge_hash(source_node, target_node)
+        else:
+            value ^= _edge_hash(source[node_id], target[node_id])
+        fingerprint[node_id] = value
+
+def _path_up(store, node_id, ancestor_id):
+    """IDs of the nodes from node_id up to, excluding, ancestor_id"""
+    parent = store.parent
+    path = []
+    while node_id != ancestor_id:
+        path.append(node_id)
+        node_id = parent[node_id]
+    return path
+
+def validate_changes(graph, changes):
+    """
+    Checks that every removal in a batch of (action, source, target) changes
+    targets an edge that exists at that point of the batch.
+    """
+    present = {}
+    for action, source_node, target_node in changes:
+        edge = frozenset((source_node, target_node))
+        exists = present.get(edge)
+        if exists is None:
+            exists = graph.has_edge(source_node, target_node)
+        if action not in (0, 1):
+            raise ValueError(f"Invalid action {action}, expected 1 (add) or 0 (remove)")
+        if action == 0 and not exists:
+            raise ValueError(f"Edge ({source_node}, {target_node}) does not exist")
+        present[edge] = action == 1
+
 def find_node_by_id(root: TimeLineNode, node_id: int) -> Optional[TimeLineNode]:
     """
     Finds a node in the timeline tree by its ID using depth-first search (DFS).
+    Prefer TimeLine.find_node, which uses the timeline's ID index.
     """
-    if root.id == node_id:
-        return root
-    
-    for child in root.children:
-        result = find_node_by_id(child, node_id)
-        if result:
-            return result
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node.id == node_id:
+            return node
+        stack.extend(reversed(node.children))
     
-    return None  # Node not found
\ No newline at end of file
+    return None  # Node not found
@@ -0,0 +1,78 @@
+import mmap
+import os
+import struct
+import numpy as np
+
+# File layout: MAGIC, then fixed-width little-endian records of
+# (id, parent_id, action, source, target). Integer node labels only.
+MAGIC = b"TLNLOG1\n"
+RECORD = struct.Struct("<qqqqq")
+RECORD_DTYPE = np.dtype([("id", "<i8"), ("parent_id", "<i8"), ("action", "<i8"),
+                         ("source", "<i8"), ("target", "<i8")])
+
+# Record actions besides 1 (add edge) and 0 (remove edge)
+LOADED_EDGE = 2  # Edge added by load_edges at node id
+MOVE = 3  # Current node set to id
+SEGMENT = 4  # Node id with source steps, in the records that follow
+
+class TimelineLog:
+    """
+    Append-only writer of timeline records. Appends are buffered until
+    flush(), which callers issue once per request or batch.
+    """
+
+    def __init__(self, path, truncate=False):
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) >= len(MAGIC)
+        if truncate or not exists:
+            self.file = open(path, "wb")
+            self.file.write(MAGIC)
+        else:
+            # Drop a partially written trailing record
+            size = os.path.getsize(path)
+            whole = len(MAGIC) + (size - len(MAGIC)) // RECORD.size * RECORD.size
+            self.file = open(path, "r+b")
+            self.file.truncate(whole)
+            self.file.seek(whole)
+
+    def append(self, node_id, parent_id, action, source, target):
+        self.file.write(RECORD.pack(node_id, parent_id, action, source, target))
+
+    def append_many(self, records):
+        self.file.write(b"".join(RECORD.pack(*record) for record in records))
+
+    def rewrite(self, records):
+        """Replaces the whole log by the given records, as after a compaction"""
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(b"".join(RECORD.pack(*record) for record in records))
+        self.file.close()
+        os.replace(temp_path, self.path)
+        self.file = open(self.path, "ab")
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+def read_records(path):
+    """
+    Reads every whole record of a log through a memory map. Returns the
+    columns as lists: (ids, parent_ids, actions, sources, targets).
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        count = (size - len(MAGIC)) // RECORD.size if size >= len(MAGIC) else 0
+        if count <= 0:
+            return [], [], [], [], []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a timeline log")
+            records = np.frombuffer(mm, dtype=RECORD_DTYPE, count=count, offset=len(MAGIC))
+            # tolist() copies, so the map can be closed afterwards
+            columns = tuple(records[name].tolist() for name in RECORD_DTYPE.names)
+            del records
+    return columns
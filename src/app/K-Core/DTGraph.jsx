@@ -39,6 +39,7 @@ export default function ForceDirectedGraph() {
     try {
       const response = await fetch('http://localhost:8000/calculate_k_cores', {
         method: 'POST',
+        credentials: 'include',
         headers: {
           'Content-Type': 'application/json'
         },
@@ -123,6 +124,7 @@ export default function ForceDirectedGraph() {
     try {
         const response = await fetch('http://localhost:8000/add_edge', {
             method: 'POST',
+            credentials: 'include',
             headers: {
                 'Content-Type': 'application/json',
             },
@@ -144,6 +146,7 @@ export default function ForceDirectedGraph() {
     try {
         const response = await fetch('http://localhost:8000/remove_edge', {
             method: 'POST',
+            credentials: 'include',
             headers: {
                 'Content-Type': 'application/json',
             },
@@ -164,6 +167,7 @@ export default function ForceDirectedGraph() {
     try {
         const response = await fetch('http://localhost:8000/remove_node', {
             method: 'POST',
+            credentials: 'include',
             headers: {
                 'Content-Type': 'application/json',
             },
@@ -192,6 +196,7 @@ export default function ForceDirectedGraph() {
     try {
       const response = await fetch('http://localhost:8000/initialize_graph', {
         method: 'POST',
+        credentials: 'include',
         headers: {
           'Content-Type': 'application/json'
         },
@@ -216,6 +221,7 @@ export default function ForceDirectedGraph() {
     try {
       const response = await fetch('http://localhost:8000/initialize_graph', {
         method: 'POST',
+        credentials: 'include',
         headers: {
           'Content-Type': 'application/json'
         },
@@ -253,6 +259,7 @@ export default function ForceDirectedGraph() {
     try {
       const response = await fetch('http://localhost:8000/get_current_graph', {
         method: 'GET',
+        credentials: 'include',
         headers: {
           'Content-Type': 'application/json'
         },
@@ -632,6 +639,7 @@ export default function ForceDirectedGraph() {
       try {
           const response = await fetch('http://localhost:8000/get_current_graph', {
               method: 'GET',
+              credentials: 'include',
               headers: {
                   'Content-Type': 'application/json'
               },
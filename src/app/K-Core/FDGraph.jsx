@@ -40,6 +40,7 @@ export default function ForceDirectedGraph() {
     try {
       const response = await fetch('http://localhost:8000/execute_algorithms', {
         method: 'POST',
+        credentials: 'include',
         headers: {
           'Content-Type': 'application/json'
         },
@@ -122,6 +123,7 @@ export default function ForceDirectedGraph() {
     try {
         const response = await fetch('http://localhost:8000/add_edge', {
             method: 'POST',
+            credentials: 'include',
             headers: {
                 'Content-Type': 'application/json',
             },
@@ -142,6 +144,7 @@ export default function ForceDirectedGraph() {
     try {
         const response = await fetch('http://localhost:8000/remove_edge', {
             method: 'POST',
+            credentials: 'include',
             headers: {
                 'Content-Type': 'application/json',
             },
@@ -162,6 +165,7 @@ export default function ForceDirectedGraph() {
     try {
         const response = await fetch('http://localhost:8000/remove_node', {
             method: 'POST',
+            credentials: 'include',
             headers: {
                 'Content-Type': 'application/json',
             },
@@ -190,6 +194,7 @@ export default function ForceDirectedGraph() {
     try {
       const response = await fetch('http://localhost:8000/initialize_graph', {
         method: 'POST',
+        credentials: 'include',
         headers: {
           'Content-Type': 'application/json'
         },
@@ -214,6 +219,7 @@ export default function ForceDirectedGraph() {
     try {
       const response = await fetch('http://localhost:8000/initialize_graph', {
         method: 'POST',
+        credentials: 'include',
         headers: {
           'Content-Type': 'application/json'
         },
@@ -251,6 +257,7 @@ export default function ForceDirectedGraph() {
     try {
       const response = await fetch('http://localhost:8000/get_current_graph', {
         method: 'GET',
+        credentials: 'include',
         headers: {
           'Content-Type': 'application/json'
         },
@@ -666,6 +673,7 @@ export default function ForceDirectedGraph() {
       try {
           const response = await fetch('http://localhost:8000/get_current_graph', {
               method: 'GET',
+              credentials: 'include',
               headers: {
                   'Content-Type': 'application/json'
               },
@@ -4,6 +4,10 @@ import { useTreeStore } from "./store";
 import { TreeHover } from "./treeHoverComponent";
 import { useActionStore } from "./store";
 
+// Navigations with a longer net diff are applied by the server instead of
+// being replayed edge by edge
+const MAX_REPLAY_STEPS = 20;
+
 export default function Tree({ height, width, xOffset = 20, yOffset = 125 }) {
   const svgRef = useRef();
   const containerRef = useRef();
@@ -11,7 +15,7 @@ export default function Tree({ height, width, xOffset = 20, yOffset = 125 }) {
   const [hoveredNode, setHoveredNode] = useState(null);
   const [nodePosition, setNodePosition] = useState({ x: 0, y: 0 });
   const [selectedPath, setSelectedPath] = useState([]);
-  const { treeData } = useTreeStore();
+  const { treeData, mergeSubtree, mergeHidden } = useTreeStore();
   const { setActionSequence, clearActionSequence } = useActionStore();
 
   const navigateToNode = async (node) => {
@@ -25,11 +29,15 @@ export default function Tree({ height, width, xOffset = 20, yOffset = 125 }) {
         headers: {
           'Content-Type': 'application/json'
         },
-        body: JSON.stringify({ node_id: String(value) })
+        body: JSON.stringify({ node_id: String(value), compress: true, max_replay: MAX_REPLAY_STEPS })
       });
   
       const data = await response.json();
-      useActionStore.getState().setActionSequence(data.action_sequence || []);
+      if (data.applied) {
+        useActionStore.getState().setNavigatedData(data);
+      } else {
+        useActionStore.getState().setActionSequence(data.action_sequence || []);
+      }
     }
     catch (error) {
       console.error("Error navigating to node:", error);
@@ -37,6 +45,43 @@ export default function Tree({ height, width, xOffset = 20, yOffset = 125 }) {
     }
   };
 
+  // Windows around the current node are not children of the node they hang from
+  const loadedChildren = (node) => node.children.filter(child => child.hidden_levels === undefined).length;
+
+  // Fetches more children of a collapsed node; the one before the offset
+  // may have been listed out of order, so it is requested again
+  const expandNode = async (node) => {
+    const params = new URLSearchParams({
+      root: node.data.id,
+      offset: Math.max(loadedChildren(node.data) - 1, 0),
+    });
+
+    try {
+      const response = await fetch(`http://localhost:8000/timeline/subtree?${params}`, {
+        credentials: 'include'
+      });
+      const data = await response.json();
+      mergeSubtree(data.subtree);
+    }
+    catch (error) {
+      console.error("Error expanding node:", error);
+    }
+  };
+
+  // Fetches the levels left out above a window around the current node
+  const expandHidden = async (node) => {
+    try {
+      const response = await fetch(`http://localhost:8000/timeline/subtree?root=${node.data.hidden_top}`, {
+        credentials: 'include'
+      });
+      const data = await response.json();
+      mergeHidden(data.subtree);
+    }
+    catch (error) {
+      console.error("Error expanding hidden levels:", error);
+    }
+  };
+
   useEffect(() => {
     setSelectedPath([]);
   }, [treeData]);
@@ -74,6 +119,7 @@ export default function Tree({ height, width, xOffset = 20, yOffset = 125 }) {
         .y(d => d.x + yOffset))
       .attr("fill", "none")
       .attr("stroke", "#ccc")
+      .attr("stroke-dasharray", d => d.target.data.hidden_levels ? "4,4" : null)
       .attr("stroke-width", 2);
 
     // Draw nodes with hover effects
@@ -150,6 +196,35 @@ export default function Tree({ height, width, xOffset = 20, yOffset = 125 }) {
         event.stopPropagation();
       });
 
+    // Collapsed nodes show how many children are not loaded yet
+    nodes.filter(d => d.data.child_count > loadedChildren(d.data))
+      .append("text")
+      .attr("dx", 8)
+      .attr("dy", 4)
+      .style("font-size", "10px")
+      .style("cursor", "pointer")
+      .attr("fill", "#666")
+      .text(d => `+${d.data.child_count - loadedChildren(d.data)}`)
+      .on("click", function(event, d) {
+        expandNode(d);
+        event.stopPropagation();
+      });
+
+    // Windows show how many levels above them are left out
+    nodes.filter(d => d.data.hidden_levels > 0)
+      .append("text")
+      .attr("dx", -8)
+      .attr("dy", -8)
+      .attr("text-anchor", "end")
+      .style("font-size", "10px")
+      .style("cursor", "pointer")
+      .attr("fill", "#666")
+      .text(d => `…${d.data.hidden_levels}`)
+      .on("click", function(event, d) {
+        expandHidden(d);
+        event.stopPropagation();
+      });
+
     // Reset zoom to initial position
     svg.call(zoom.transform, d3.zoomIdentity);
 
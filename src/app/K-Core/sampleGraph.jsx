@@ -47,7 +47,7 @@ export default function SampleGraph() {
 
   // Managing Tree State
   const { setTreeData } = useTreeStore();
-  const { actionSequence, clearActionSequence } = useActionStore();
+  const { actionSequence, clearActionSequence, navigatedData, setNavigatedData } = useActionStore();
 
   // Graph Stats
   const [density, setDensity] = useState(0);
@@ -72,8 +72,21 @@ export default function SampleGraph() {
     }, 200);
   }, []);
 
-  const handleModifyTree = async (data) => {
-    setTreeData(data);
+  // Mutation responses no longer carry the timeline; fetch it from the root,
+  // which includes a window around the current node when it lies deeper
+  const handleModifyTree = async () => {
+    try {
+      const response = await fetch('http://localhost:8000/timeline/subtree?root=1', {
+        credentials: 'include',
+      });
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      const data = await response.json();
+      setTreeData(data.subtree);
+    } catch (error) {
+      console.error('Error fetching timeline subtree:', error);
+    }
   };
 
   // Initialize graph and prune queue
@@ -96,8 +109,7 @@ export default function SampleGraph() {
         const data = await response.json();
         //console.log('Initial graph data:', data);
 
-        const treeData = data.timeline;
-        await handleModifyTree(treeData);
+        await handleModifyTree();
 
         const processedData = processGraphData(data);
         //console.log('Processed graph data:', processedData);
@@ -511,7 +523,7 @@ export default function SampleGraph() {
       console.log('link after setting:', links);
       if (algo_running === '0' || algo_running === '1') {
         console.log('Updating Tree State');
-        await handleModifyTree(updatedData.timeline);
+        await handleModifyTree();
       }
 
       console.log('Final edge count:', links.length);
@@ -662,7 +674,7 @@ export default function SampleGraph() {
       stabilizeGraph();
 
       if (algo_running === '0' || algo_running === '1') {
-        await handleModifyTree(updatedData.timeline);
+        await handleModifyTree();
       }
 
       setTimeout(() => {
@@ -743,6 +755,20 @@ export default function SampleGraph() {
     processActions();
   }, [actionSequence]);
 
+  // The server restored the graph of a distant timeline node; show it at once
+  useEffect(() => {
+    if (!navigatedData) return;
+    const processedData = processGraphData(navigatedData);
+    setNodes(processedData.nodes);
+    setLinks(processedData.edges);
+    setPruneQueue(processedData.pruneSteps);
+    setCurrentPruneStep(0);
+    setIsAutoPruning(false);
+    setIsPruning(false);
+    setDatasets(navigatedData);
+    setNavigatedData(null);
+  }, [navigatedData]);
+
   //for clearing the graph
   const clearSvg = () => {
     console.log('Clear Graph button clicked');
@@ -776,6 +802,7 @@ export default function SampleGraph() {
     try {
       const response = await fetch('http://localhost:8000/get_current_graph', {
         method: 'GET',
+        credentials: 'include',
         headers: {
           'Content-Type': 'application/json',
         },
@@ -844,7 +871,7 @@ export default function SampleGraph() {
       setIsAutoPruning(false);
       setIsPruning(false);
       setDatasets(data);
-      await handleModifyTree(data.timeline);
+      await handleModifyTree();
       console.log('Processed graph data:', processedData);
     } catch (error) {
       console.error('Error uploading graph:', error);
@@ -10,6 +10,35 @@ export const useTreeStore = create((set) => ({
       console.warn('Invalid tree data format:', newData);
     }
   },
+
+  // Adds the children of a lazily fetched subtree to the node it starts at
+  mergeSubtree: (subtree) =>
+    set((state) => {
+      if (!state.treeData || !subtree) return {};
+      const graft = (node) => {
+        if (node.id === subtree.id) {
+          const known = new Set(node.children.map((child) => child.id));
+          return {
+            ...node,
+            child_count: subtree.child_count,
+            children: [...node.children, ...subtree.children.filter((child) => !known.has(child.id))],
+          };
+        }
+        return { ...node, children: node.children.map(graft) };
+      };
+      return { treeData: graft(state.treeData) };
+    }),
+
+  // Puts a fetched subtree in place of the window whose hidden levels start at it
+  mergeHidden: (subtree) =>
+    set((state) => {
+      if (!state.treeData || !subtree) return {};
+      const fill = (node) => ({
+        ...node,
+        children: node.children.map((child) => (child.hidden_top === subtree.id ? subtree : fill(child))),
+      });
+      return { treeData: fill(state.treeData) };
+    }),
 }));
 
 export const useActionStore = create((set) => ({
@@ -29,4 +58,11 @@ export const useActionStore = create((set) => ({
     set({ actionSequence: [], isProcessing: false });
     console.log("Action sequence cleared");
   },
+
+  // Graph data of a navigation the server applied itself (no replay needed)
+  navigatedData: null,
+
+  setNavigatedData: (data) => {
+    set({ navigatedData: data });
+  },
 }));
\ No newline at end of file
@@ -11,6 +11,7 @@ export const TreeHover = memo(({ nodeData }) => {
     switch (action) {
       case 0: return { text: 'Delete edge:', color: 'text-red-500' };
       case 1: return { text: 'Add edge:', color: 'text-green-600' };
+      case 2: return { text: 'Collapsed edge changes', color: 'text-yellow-400' };
       default: return { text: 'Root Node:', color: 'text-white' };
     }
   };
@@ -29,7 +30,7 @@ export const TreeHover = memo(({ nodeData }) => {
     <div className="space-y-1">
       <h4 className="text-sm font-semibold text-white">Node ID: {nodeData.id}</h4>
       <p className={`text-sm ${color}`}>
-        {text} {edge || 'N/A'}
+        {text} {nodeData.action === 2 ? '' : edge || 'N/A'}
       </p>
     </div>
   </div>